@@ -0,0 +1,24 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+'''
+Runs all offline benchmarks: python -m benchmarks
+'''
+
+from benchmarks import bench_decode, bench_download, bench_import, bench_mask
+
+if __name__ == '__main__':
+    for benchmark in (bench_mask, bench_decode, bench_import, bench_download):
+        print("\n# " + benchmark.__name__)
+        benchmark.run()
@@ -0,0 +1,52 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+'''
+Decodes synthetic SF and RW composites with wradlib and the native decoder, both gzipped like recent files and uncompressed like files of
+the monthly archives.
+Run from the repository root: python -m benchmarks.bench_decode
+'''
+
+import os
+import tempfile
+from datetime import datetime
+
+import wradlib
+
+from benchmarks.measure import print_header, print_result, timed
+from benchmarks.synthetic import write_composites
+from radolan_lib.radolan import Decoder
+
+
+def run(count: int = 24):
+    print_header()
+    with tempfile.TemporaryDirectory() as tmp:
+        for product in ("SF", "RW"):
+            for compressed in (True, False):
+                files = write_composites(os.path.join(tmp, product + str(compressed)), product,
+                                         datetime(2021, 6, 1, 5, 50), count, compressed)
+                nbytes = sum(os.path.getsize(file) for file in files)
+                for name, read in (("wradlib", wradlib.io.read_radolan_composite),
+                                   ("native", Decoder.read_radolan_composite)):
+                    cells = 0
+                    with timed() as seconds:
+                        for file in files:
+                            data, _ = read(file)
+                            cells += data.size
+                    print_result(name + " " + product + (" gz" if compressed else ""), seconds[0],
+                                 files=len(files), points=cells, nbytes=nbytes)
+
+
+if __name__ == '__main__':
+    run()
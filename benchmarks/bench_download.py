@@ -0,0 +1,70 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+'''
+Downloads synthetic files with the FtpLoader from a local HTTP mirror of the DWD directory layout: the recent gzipped
+composites of the running year and a monthly archive of a past year.
+Run from the repository root: python -m benchmarks.bench_download
+'''
+
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.measure import print_header, print_result, timed
+from benchmarks.synthetic import write_archive, write_composites
+from radolan_lib.radolan.Ftploader import FtpLoader
+from radolan_lib.radolan.Products import RW
+
+RECENT_PATH = "climate_environment/CDC/grids_germany/hourly/radolan/recent/bin/"
+HISTORICAL_PATH = "climate_environment/CDC/grids_germany/hourly/radolan/historical/bin/"
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def run(recent_files: int = 48, archive_files: int = 96, workers=(1, 4)):
+    print_header()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "mirror")
+        year = datetime.now().year
+        write_composites(os.path.join(root, RECENT_PATH), "RW", datetime(year, 1, 1, 0, 50), recent_files)
+        write_archive(os.path.join(root, HISTORICAL_PATH, str(year - 1)), "RW", datetime(year - 1, 1, 1, 0, 50),
+                      archive_files)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=root))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = "http://127.0.0.1:" + str(server.server_address[1]) + "/"
+        try:
+            for download_workers in workers:
+                for name, download_year in (("recent", year), ("archive", year - 1)):
+                    datadir = os.path.join(tmp, "data")
+                    loader = FtpLoader(RW, datadir=datadir, download_workers=download_workers, base_url=base_url)
+                    with timed() as seconds:
+                        files = list(loader.iter_downloads(download_year))
+                    print_result("FtpLoader " + name + " workers=" + str(download_workers), seconds[0],
+                                 files=len(files), nbytes=sum(os.path.getsize(file) for file in files))
+                    shutil.rmtree(datadir)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,60 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+'''
+Imports synthetic composites end to end with RadolanImport.import_file, publishing to a stub of the import-lib.
+Run from the repository root: python -m benchmarks.bench_import
+'''
+
+import os
+import tempfile
+from datetime import datetime
+
+from benchmarks.measure import print_header, print_result, timed
+from benchmarks.stub import StubImportLib
+from benchmarks.synthetic import write_composites
+from radolan_lib.radolan.Products import str_to_product
+from radolan_lib.radolan.RadolanImport import RadolanImport
+
+# points/s counts messages handed to the import-lib, grid messages hold many cells each
+SCENARIOS = {
+    "all points": {},
+    "bbox leipzig": {"BBOXES": [[12.178688, 51.247304, 12.572479, 51.439885]]},
+    "bbox germany": {"BBOXES": [[5.8, 47.2, 15.1, 55.1]]},
+    "grid int16": {"OUTPUT_FORMAT": "grid", "GRID_ENCODING": "int16"},
+    "tiles 5x5": {"TILE_SIZE": 5},
+}
+
+
+def run(count: int = 6):
+    print_header()
+    with tempfile.TemporaryDirectory() as tmp:
+        for product in ("SF", "RW"):
+            files = write_composites(os.path.join(tmp, product), product, datetime(2021, 6, 1, 5, 50), count)
+            nbytes = sum(os.path.getsize(file) for file in files)
+            for name, config in SCENARIOS.items():
+                config = dict(config, DATA_DIR=os.path.join(tmp, "data"), GRID_CACHE_DIR=os.path.join(tmp, "grid"))
+                lib = StubImportLib(config)
+                with timed() as seconds:
+                    radolan_import = RadolanImport(lib, product=str_to_product(product))
+                print_result("prepare " + product + " " + name, seconds[0])
+                with timed() as seconds:
+                    for file in files:
+                        radolan_import.import_file(file, delete_file=False)
+                print_result("import_file " + product + " " + name, seconds[0], files=len(files), points=lib.points,
+                             nbytes=nbytes)
+
+
+if __name__ == '__main__':
+    run()
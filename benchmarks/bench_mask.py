@@ -0,0 +1,46 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+'''
+Compares the list-of-tuples create_mask with the vectorized create_mask_array.
+Run from the repository root: python -m benchmarks.bench_mask
+'''
+
+import time
+
+from benchmarks.synthetic import synthetic_grid, random_bboxes
+from radolan_lib.util.bbox import create_mask, create_mask_array, mask_to_indices
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(bbox_counts=(1, 10, 100)):
+    grid = synthetic_grid()
+    print("%8s %10s %14s %14s %9s" % ("bboxes", "cells", "create_mask", "vectorized", "speedup"))
+    for count in bbox_counts:
+        bboxes = random_bboxes(count)
+        expected, t_list = _timed(create_mask, grid, bboxes)
+        mask, t_vec = _timed(create_mask_array, grid, bboxes)
+        rows, cols = mask_to_indices(mask)
+        if list(zip(rows.tolist(), cols.tolist())) != expected:
+            raise AssertionError("Vectorized mask differs from create_mask for " + str(count) + " bboxes")
+        print("%8d %10d %13.3fs %13.4fs %8.0fx" % (count, len(expected), t_list, t_vec, t_list / max(t_vec, 1e-9)))
+
+
+if __name__ == '__main__':
+    run()
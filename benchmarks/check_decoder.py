@@ -0,0 +1,79 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+'''
+Cross-checks the native decoder against wradlib. Synthetic SF and RW composites are always checked, real DWD files can
+be added as arguments. Exits with 1 if any output differs.
+Run from the repository root: python -m benchmarks.check_decoder [files...]
+'''
+
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import wradlib
+
+from benchmarks.synthetic import write_composites
+from radolan_lib.radolan import Decoder
+
+
+def compare(file: str) -> List[str]:
+    '''
+    :param file: local filename
+    :return: descriptions of all differences, empty if the outputs are identical
+    '''
+    expected, expected_attrs = wradlib.io.read_radolan_composite(file)
+    differences = []
+    with open(file, "rb") as f:
+        sources = {"path": file, "file object": io.BytesIO(f.read())}
+    for source, arg in sources.items():
+        data, attrs = Decoder.read_radolan_composite(arg)
+        if data.shape != expected.shape or data.dtype != expected.dtype or not np.array_equal(data, expected):
+            differences.append(source + ": data differs")
+        for key, value in attrs.items():
+            if key not in expected_attrs:
+                continue
+            other = expected_attrs[key]
+            if isinstance(value, np.ndarray) or isinstance(other, np.ndarray):
+                if not np.array_equal(np.asarray(value), np.asarray(other)):
+                    differences.append(source + ": " + key + " differs, " + str(np.size(value)) + " instead of " +
+                                       str(np.size(other)) + " entries")
+            elif value != other:
+                differences.append(source + ": " + key + " is " + str(value) + " instead of " + str(other))
+    return differences
+
+
+def run(files: List[str] = None, count: int = 4) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        files = list(files or [])
+        for product in Decoder.SUPPORTED_PRODUCTS:
+            for compressed in (True, False):
+                files += write_composites(os.path.join(tmp, product + str(compressed)), product,
+                                          datetime(2021, 6, 1, 5, 50), count, compressed)
+        failed = False
+        for file in files:
+            differences = compare(file)
+            for difference in differences:
+                print(os.path.basename(file) + " " + difference)
+            failed = failed or len(differences) > 0
+        print(("FAILED" if failed else "OK") + ": checked " + str(len(files)) + " files")
+        return not failed
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run(sys.argv[1:]) else 1)
@@ -0,0 +1,64 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, List
+
+
+def peak_rss_mb() -> float:
+    '''
+    :return: peak resident set size of this process in MB
+    '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes on macOS, kilobytes elsewhere
+        return rss / 1024 / 1024
+    return rss / 1024
+
+
+@contextmanager
+def timed() -> Iterator[List[float]]:
+    '''
+    Context manager measuring wall clock time. The seconds are stored in the yielded list once the block is left.
+    '''
+    result = [0.0]
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result[0] = time.perf_counter() - start
+
+
+def print_header() -> None:
+    print("%-32s %9s %10s %12s %9s %10s" % ("benchmark", "seconds", "files/s", "points/s", "MB/s", "peak RSS"))
+
+
+def print_result(name: str, seconds: float, files: int = 0, points: int = 0, nbytes: int = 0) -> None:
+    '''
+    Prints a line of results. Rates of quantities that were not measured are left empty.
+
+    :param name: name of the benchmark
+    :param seconds: duration
+    :param files: number of files processed
+    :param points: number of points decoded or published
+    :param nbytes: number of bytes read or transferred
+    '''
+    seconds = max(seconds, 1e-9)
+    print("%-32s %9.3f %10s %12s %9s %8.0fMB" % (name, seconds,
+                                                  "%.1f" % (files / seconds) if files > 0 else "-",
+                                                  "%.0f" % (points / seconds) if points > 0 else "-",
+                                                  "%.1f" % (nbytes / seconds / 1e6) if nbytes > 0 else "-",
+                                                  peak_rss_mb()))
@@ -0,0 +1,38 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+
+class StubImportLib:
+    def __init__(self, config: Dict[str, Any] = None):
+        '''
+        Stand-in for the import-lib, which counts published points instead of sending them to Kafka
+
+        :param config: configs as they would be set in the environment
+        '''
+        self.config = config if config is not None else {}
+        self.points = 0
+        self.last = None  # type: Optional[datetime]
+
+    def get_config(self, name: str, default: Any) -> Any:
+        return self.config.get(name, default)
+
+    def put(self, date_time: datetime, value: Dict) -> None:
+        self.points += 1
+        self.last = date_time
+
+    def get_last_published_datetime(self) -> Tuple[Optional[datetime], Optional[Dict]]:
+        return self.last, None
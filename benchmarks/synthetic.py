@@ -0,0 +1,171 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import gzip
+import io
+import os
+import tarfile
+from datetime import datetime, timedelta
+from typing import List
+
+import numpy as np
+
+# Interval of the supported products in minutes
+PRODUCT_INTERVALS = {"SF": 1440, "RW": 60}
+
+# Flags of the 16 bit radolan payload, values use the lower 12 bits
+VALUE_MASK = 0x0FFF
+SECONDARY_FLAG = 0x1000
+NODATA_FLAG = 0x2000
+NEGATIVE_FLAG = 0x4000
+CLUTTER_FLAG = 0x8000
+NODATA_VALUE = 0x29C4  # raw value DWD uses for cells outside the composite
+
+_RADARS = "boo,ros,emd,hnr,umd,pro,ess,fld,drs,neu,nhb,oft,eis,tur,isn,fbg,mem"
+
+
+def synthetic_grid(dim_x: int = 900, dim_y: int = 900) -> np.ndarray:
+    '''
+    Creates a coordinate grid roughly shaped like the reprojected radolan grid in EPSG:4326. Slightly skewed to mimic
+    the stereographic projection, so bounding boxes don't align with grid rows or columns.
+    :param dim_x: number of rows
+    :param dim_y: number of columns
+    :return: ndarray of shape (dim_x, dim_y, 2) holding (long, lat) pairs
+    '''
+    i, j = np.meshgrid(np.arange(dim_x, dtype=float), np.arange(dim_y, dtype=float), indexing="ij")
+    long = 3.6 + j * 0.0146 + (i - dim_x / 2) * 0.0011
+    lat = 46.95 + i * 0.0099 - (j - dim_y / 2) ** 2 * 0.0000012
+    return np.stack([long, lat], axis=-1)
+
+
+def random_bboxes(count: int, seed: int = 42):
+    '''
+    Creates bounding boxes spread over Germany
+    :param count: number of bounding boxes
+    :param seed: random seed
+    :return: list of bounding boxes as [min Longitude, min Latitude, max Longitude, max Latitude]
+    '''
+    rng = np.random.default_rng(seed)
+    bboxes = []
+    for _ in range(count):
+        long = rng.uniform(6.0, 14.5)
+        lat = rng.uniform(47.5, 54.5)
+        bboxes.append([long, lat, long + rng.uniform(0.05, 0.5), lat + rng.uniform(0.05, 0.3)])
+    return bboxes
+
+
+def synthetic_field(seed: int = 0, shape=(900, 900)) -> np.ndarray:
+    '''
+    Creates a precipitation field of a few rain cells on a dry background. Cells outside a circle around the center are
+    set to NaN, similar to the area not covered by the composite.
+    :param seed: random seed
+    :param shape: (rows, columns)
+    :return: float ndarray in mm
+    '''
+    rng = np.random.default_rng(seed)
+    i, j = np.ogrid[0:shape[0], 0:shape[1]]
+    field = np.zeros(shape)
+    for _ in range(rng.integers(5, 15)):
+        ci, cj = rng.uniform(0, shape[0]), rng.uniform(0, shape[1])
+        radius = rng.uniform(10, 80)
+        field += rng.uniform(1, 60) * np.exp(-((i - ci) ** 2 + (j - cj) ** 2) / (2 * radius ** 2))
+    field[field < 0.1] = 0
+    field[(i - shape[0] / 2) ** 2 + (j - shape[1] / 2) ** 2 > (0.55 * min(shape)) ** 2] = np.nan
+    return field
+
+
+def radolan_composite(product: str, date_time: datetime, seed: int = 0, shape=(900, 900)) -> bytes:
+    '''
+    Encodes a synthetic field as radolan composite in the binary format DWD uses for SF and RW: an ASCII header
+    terminated by ETX, followed by little endian 16 bit values with a precision of 0.1 mm and flags in the upper bits
+    :param product: SF or RW
+    :param date_time: timestamp of the data
+    :param seed: random seed
+    :param shape: (rows, columns)
+    :return: uncompressed file content
+    '''
+    field = synthetic_field(seed, shape)
+    nodata = np.isnan(field)
+    raw = np.minimum(np.round(np.nan_to_num(field) * 10), VALUE_MASK).astype(np.uint16)
+    rng = np.random.default_rng(seed + 1)
+    raw[rng.random(shape) < 0.01] |= SECONDARY_FLAG
+    raw[rng.random(shape) < 0.001] |= CLUTTER_FLAG
+    raw[nodata] = NODATA_VALUE
+    payload = raw.astype("<u2").tobytes()
+
+    def header(size: int) -> str:
+        return product + date_time.strftime("%d%H%M") + "10000" + date_time.strftime("%m%y") + \
+            "BY" + str(size).rjust(7) + "VS 3SW" + "2.18.3".rjust(9) + "PR E-01" + \
+            "INT" + str(PRODUCT_INTERVALS[product]).rjust(4) + \
+            "GP" + (str(shape[0]).rjust(4) + "x" + str(shape[1]).rjust(4)) + \
+            "MS" + str(len(_RADARS) + 2).rjust(3) + "<" + _RADARS + ">"
+
+    size = len(header(0)) + 1 + len(payload)
+    return header(size).encode("ascii") + b"\x03" + payload
+
+
+def composite_name(product: str, date_time: datetime, compressed: bool = True) -> str:
+    '''
+    :return: filename DWD uses for a composite, e.g. raa01-rw_10000-2001010050-dwd---bin.gz
+    '''
+    return "raa01-" + product.lower() + "_10000-" + date_time.strftime("%y%m%d%H%M") + "-dwd---bin" + \
+        (".gz" if compressed else "")
+
+
+def composite_times(product: str, start: datetime, count: int) -> List[datetime]:
+    '''
+    :return: count timestamps in the interval of product, beginning with start
+    '''
+    return [start + timedelta(minutes=PRODUCT_INTERVALS[product] * n) for n in range(count)]
+
+
+def write_composites(directory: str, product: str, start: datetime, count: int, compressed: bool = True) -> List[str]:
+    '''
+    Writes synthetic composites with DWD filenames
+    :param directory: target folder
+    :param product: SF or RW
+    :param start: timestamp of the first file
+    :param count: number of files
+    :param compressed: gzip files like the recent files of DWD
+    :return: filenames in chronological order
+    '''
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for n, date_time in enumerate(composite_times(product, start, count)):
+        content = radolan_composite(product, date_time, seed=n)
+        file = os.path.join(directory, composite_name(product, date_time, compressed))
+        with open(file, "wb") as f:
+            f.write(gzip.compress(content, compresslevel=6) if compressed else content)
+        files.append(file)
+    return files
+
+
+def write_archive(directory: str, product: str, start: datetime, count: int) -> str:
+    '''
+    Writes a monthly tar.gz of uncompressed synthetic composites like the historic archives of DWD
+    :param directory: target folder
+    :param product: SF or RW
+    :param start: timestamp of the first file, the archive is named after its month
+    :param count: number of files
+    :return: filename of the archive
+    '''
+    os.makedirs(directory, exist_ok=True)
+    archive = os.path.join(directory, product + start.strftime("%Y%m") + ".tar.gz")
+    with tarfile.open(archive, "w:gz") as tar:
+        for n, date_time in enumerate(composite_times(product, start, count)):
+            content = radolan_composite(product, date_time, seed=n)
+            info = tarfile.TarInfo(composite_name(product, date_time, compressed=False))
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return archive
@@ -12,55 +12,156 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-import time
-from datetime import datetime
 
-import schedule
+import asyncio
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Awaitable, Dict, List, Optional
+
 from import_lib.import_lib import ImportLib, get_logger
 
+from radolan_lib.radolan.BackfillPlanner import BackfillPlanner
+from radolan_lib.radolan.Checkpoint import Checkpoint
+from radolan_lib.radolan.Ftploader import MANIFEST_FILE
+from radolan_lib.radolan.Manifest import Manifest
 from radolan_lib.radolan.Products import str_to_product
-from radolan_lib.radolan.RadolanImport import RadolanImport
+from radolan_lib.radolan.RadolanImport import RadolanImport, ImportStopped, open_frame_archive
+from radolan_lib.util.limits import HostLimiter
+from radolan_lib.util.metrics import start_metrics_server
+from radolan_lib.util.priority import PriorityGate
 
-if __name__ == '__main__':
+logger = get_logger(__name__)
+
+
+def run_backfill(planner: BackfillPlanner, import_years: List[int], starts: Dict[str, Optional[datetime]]):
+    try:
+        failed = planner.run(import_years, starts)
+        if len(failed) > 0:
+            logger.error("Historic import finished, but failed for " + ", ".join(failed))
+        else:
+            logger.info("Historic import finished")
+    except ImportStopped:
+        logger.info("Historic import stopped")
+
+
+def run_live_import(radolan_imports: List[RadolanImport], gate: PriorityGate):
+    with gate.priority():
+        for radolan_import in radolan_imports:
+            try:
+                radolan_import.import_most_recent()
+            except Exception as e:
+                logger.error("Import of most recent data failed: " + str(e))
 
+
+async def run_live(radolan_imports: List[RadolanImport], gate: PriorityGate, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="radolan-live")
+    minute = datetime.now().minute
+    logger.info("Setting schedule to run each hour at minute " + str(minute).zfill(2))
+    try:
+        while not stop.is_set():
+            await loop.run_in_executor(executor, run_live_import, radolan_imports, gate)
+            now = datetime.now()
+            next_run = now.replace(minute=minute, second=0, microsecond=0)
+            while next_run <= now:
+                next_run += timedelta(hours=1)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=(next_run - now).total_seconds())
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        executor.shutdown(wait=True)
+
+
+async def run_after(first: Awaitable, then: Awaitable):
+    await first
+    await then
+
+
+async def main():
     lib = ImportLib()
-    logger = get_logger(__name__)
+    start_metrics_server(lib.get_config("METRICS_PORT", 0), lib.get_config("METRICS_HOST", "127.0.0.1"))
     product = lib.get_config("PRODUCT", "SF")
+    product_names = [name.upper() for name in lib.get_config("PRODUCTS", [product])]
     try:
-        product = str_to_product(product)
+        products = {name: str_to_product(name) for name in product_names}
     except ValueError as e:
         logger.error(e)
         logger.error("Can't run with this product name. Exiting!")
         quit(1)
 
-    radolan_import = RadolanImport(lib, product=product)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    gate = PriorityGate()
+    datadir = lib.get_config("DATA_DIR", None)
+    # The backfill checkpoints only survive restarts in a configured DATA_DIR. Otherwise the backfill has to finish
+    # before the live import moves the import-lib state, which is where a missing checkpoint is resumed from.
+    concurrent = datadir is not None and len(datadir) > 0
+    if not concurrent:
+        datadir = os.sep + 'tmp' + os.sep + 'radolan'
+    archives = {name: open_frame_archive(lib, products[name]) for name in product_names}
+    # Live and historic imports both download recent files and remove them once imported, so they use separate folders
+    live_imports = [RadolanImport(lib, product=products[name], download_dir=datadir + os.sep + "live",
+                                  archive=archives[name])
+                    for name in product_names]
 
-    state, _ = lib.get_last_published_datetime()
-    if state is None:
-        logger.info("Import is starting fresh")
+    planner = None
+    backfill = None
+    import_years = lib.get_config("IMPORT_YEARS", [])
+    if len(import_years) > 0:
+        if not concurrent:
+            logger.warning("DATA_DIR is not set, so the most recent data is only imported once the historic import "
+                           "finished. Set DATA_DIR to a persistent volume to run both at the same time!")
+        backfill_imports = {}
+        starts = {}
+        # Downloads of all products share the limit, the live import is not limited
+        limiter = HostLimiter(lib.get_config("BACKFILL_HOST_CONCURRENCY", 2))
+        for name in product_names:
+            checkpoint = Checkpoint(datadir + os.sep + "backfill-" + name + ".json")
+            if checkpoint.get() is None:
+                # No live import published yet, so the import-lib state is the progress of the previous backfill.
+                # The import-lib state belongs to PRODUCT, other products have not been imported before.
+                state = None
+                if name == product.upper():
+                    state, _ = lib.get_last_published_datetime()
+                checkpoint.set(state if state is not None else datetime.min)
+            starts[name] = checkpoint.get() if checkpoint.get() != datetime.min else None
+            if starts[name] is None:
+                logger.info("Import of " + name + " is starting fresh")
+            else:
+                logger.info("Import of " + name + " is continuing previous import")
+            backfill_imports[name] = RadolanImport(lib, product=products[name], gate=gate, checkpoint=checkpoint,
+                                                   download_dir=datadir + os.sep + "backfill", archive=archives[name],
+                                                   limiter=limiter)
+        planner = BackfillPlanner(backfill_imports, Manifest(datadir + os.sep + MANIFEST_FILE),
+                                  workers=lib.get_config("BACKFILL_WORKERS", 4),
+                                  prefetch=lib.get_config("BACKFILL_PREFETCH", 2))
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="radolan-backfill")
+        backfill = loop.run_in_executor(executor, run_backfill, planner, import_years, starts)
+        executor.shutdown(wait=False)
+
+    if backfill is None:
+        tasks = [asyncio.ensure_future(run_live(live_imports, gate, stop))]
+    elif concurrent:
+        tasks = [asyncio.ensure_future(run_live(live_imports, gate, stop)), backfill]
     else:
-        logger.info("Import is continuing previous import")
+        tasks = [asyncio.ensure_future(run_after(backfill, run_live(live_imports, gate, stop)))]
 
-    import_years = lib.get_config("IMPORT_YEARS", [])
-    for year in import_years:
-        if state is not None and state.year > year:
-            logger.info("Not reimporting data from " + str(year))
-            continue
-        elif state is not None and state.year == year:
-            logger.info("Partially importing data from " + str(year))
-            radolan_import.import_from_year(year, state)
-        else:
-            logger.info("Importing full data from " + str(year))
-            radolan_import.import_from_year(year)
+    def shutdown():
+        logger.info("Shutting down")
+        stop.set()
+        if planner is not None:
+            planner.stop()
 
-    radolan_import.import_most_recent()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shutdown)
+    await asyncio.gather(*tasks)
+    for archive in archives.values():
+        if archive is not None:
+            archive.close()
 
-    minute = str(datetime.now().minute)
-    if len(minute) == 1:
-        minute = "0" + minute
-    logger.info("Setting schedule to run each hour at minute " + minute)
-    schedule.every().hour.at(":" + minute).do(radolan_import.import_most_recent)
 
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from import_lib.import_lib import get_logger
+
+from radolan_lib.radolan.DownloadPool import DownloadPool
+from radolan_lib.radolan.Manifest import Manifest
+from radolan_lib.radolan.RadolanImport import RadolanImport, ImportStopped
+from radolan_lib.util.filenames import next_month
+
+logger = get_logger(__name__)
+
+
+class WorkUnit(NamedTuple):
+    product: str
+    year: int
+    month: int
+    start: Optional[datetime]
+
+    @property
+    def name(self) -> str:
+        return self.product + "-" + str(self.year) + str(self.month).zfill(2)
+
+
+def plan_units(products: List[str], years: List[int], starts: Dict[str, Optional[datetime]],
+               now: datetime = None) -> List[WorkUnit]:
+    '''
+    Splits a backfill into monthly work units
+
+    :param products: product names
+    :param years: years to import
+    :param starts: per product the datetime to continue from, None to import everything
+    :param now: Optional current datetime, months starting later are not planned
+    :return: units of each product in chronological order. Months before the start of a product are skipped, the
+     month of the start only imports data from the start on.
+    '''
+    if now is None:
+        now = datetime.now()
+    units = []
+    for product in products:
+        start = starts.get(product)
+        for year in sorted(set(years)):
+            for month in range(1, 13):
+                begin = datetime(year, month, 1)
+                if begin > now:
+                    break
+                if start is not None and next_month(begin) <= start:
+                    continue
+                units.append(WorkUnit(product, year, month, start if start is not None and start > begin else None))
+    return units
+
+
+class BackfillPlanner:
+    def __init__(self, imports: Dict[str, RadolanImport], manifest: Manifest, workers: int = 4, prefetch: int = 2):
+        '''
+        Runs backfills of multiple products as monthly work units. Units are downloaded on a shared pool, but each
+        product is published in chronological order. Completed units are recorded in the manifest and skipped on
+        restarts. Pass a shared HostLimiter to the imports to limit the concurrent downloads from one host.
+
+        :param imports: per product name the import to publish with
+        :param manifest: manifest to record completed units in
+        :param workers: Number of units downloaded concurrently
+        :param prefetch: Number of units of a product downloaded ahead of publishing
+        '''
+        self.__imports = imports
+        self.__manifest = manifest
+        self.__workers = workers
+        self.__prefetch = prefetch
+        self.__stop = threading.Event()
+
+    def run(self, years: List[int], starts: Dict[str, Optional[datetime]]) -> List[str]:
+        '''
+        Imports all units of the given years, which were not completed before. A failing product doesn't stop the
+        others. The decoding processes of the imports are stopped afterwards.
+
+        :param years: years to import
+        :param starts: per product the datetime to continue from, None to import everything
+        :return: names of the products whose import failed
+        :except ImportStopped: if stop was called
+        '''
+        units = plan_units(list(self.__imports.keys()), years, starts)
+        pending = [unit for unit in units if not self.__manifest.is_unit_done(unit.name)]
+        if len(pending) < len(units):
+            logger.info("Skipping " + str(len(units) - len(pending)) + " completed units")
+        pool = DownloadPool(workers=self.__workers)
+        executor = ThreadPoolExecutor(max_workers=len(self.__imports), thread_name_prefix="radolan-backfill")
+        stopped = False
+        failed = []
+        try:
+            futures = {product: executor.submit(self.__run_product, product,
+                                                [unit for unit in pending if unit.product == product], pool)
+                       for product in self.__imports}
+            for product, future in futures.items():
+                try:
+                    future.result()
+                except ImportStopped:
+                    stopped = True
+                except Exception as e:
+                    logger.error("Historic import of " + product + " failed: " + str(e))
+                    failed.append(product)
+        finally:
+            executor.shutdown(wait=True)
+            pool.shutdown()
+            for radolan_import in self.__imports.values():
+                radolan_import.close()
+        if stopped:
+            raise ImportStopped()
+        return failed
+
+    def stop(self) -> None:
+        '''
+        Stops running backfills. Downloads in progress are completed, but not published.
+        '''
+        self.__stop.set()
+        for radolan_import in self.__imports.values():
+            radolan_import.stop()
+
+    def __run_product(self, product: str, units: List[WorkUnit], pool: DownloadPool) -> None:
+        radolan_import = self.__imports[product]
+        downloads = pool.map_ordered(lambda unit: self.__download(radolan_import, unit), units,
+                                     prefetch=self.__prefetch)
+        for unit, files in zip(units, downloads):
+            logger.info("Importing unit " + unit.name)
+            radolan_import.import_downloads(files, start=unit.start, name="import-" + unit.name)
+            # Units of the running month get more data, so they are never completed
+            if len(files) > 0 and next_month(datetime(unit.year, unit.month, 1)) <= datetime.now():
+                self.__manifest.mark_unit_done(unit.name)
+        logger.info("Historic import of " + product + " finished")
+
+    def __download(self, radolan_import: RadolanImport, unit: WorkUnit) -> List[str]:
+        if self.__stop.is_set():
+            raise ImportStopped()
+        return radolan_import.download_month(unit.year, unit.month, start=unit.start)
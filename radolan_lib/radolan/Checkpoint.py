@@ -0,0 +1,64 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+from import_lib.import_lib import get_logger
+
+logger = get_logger(__name__)
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        '''
+        Persists the datetime of the newest published data of a single import stream. Needed for backfills running
+        next to the live import, since the import-lib only knows the newest datetime published by any of them.
+
+        :param path: JSON file to store the checkpoint in
+        '''
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__value = None  # type: Optional[datetime]
+        try:
+            with open(path) as f:
+                self.__value = datetime.fromisoformat(json.load(f)["datetime"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Could not read checkpoint " + path + ": " + str(e))
+
+    def get(self) -> Optional[datetime]:
+        '''
+        :return: the stored datetime or None, if nothing was stored yet
+        '''
+        return self.__value
+
+    def set(self, date_time: datetime) -> None:
+        '''
+        Stores a datetime. The file is replaced atomically, so a crash never leaves a corrupt checkpoint.
+
+        :param date_time: datetime of the newest published data
+        '''
+        with self.__lock:
+            if self.__value is not None and date_time <= self.__value:
+                return
+            self.__value = date_time
+            tmp = self.__path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"datetime": date_time.isoformat()}, f)
+            os.replace(tmp, self.__path)
@@ -0,0 +1,113 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from import_lib.import_lib import get_logger
+
+from radolan_lib.radolan.Decoder import read_composite
+
+logger = get_logger(__name__)
+
+ROWS_FILE = "rows.npy"
+COLS_FILE = "cols.npy"
+
+Selection = Tuple[Dict, np.ndarray, np.ndarray]
+Result = Tuple[Optional[Selection], float, float]
+
+_rows = None  # type: Optional[np.ndarray]
+_cols = None  # type: Optional[np.ndarray]
+_native = True
+
+
+def _init_worker(shared_dir: str, native: bool) -> None:
+    global _rows, _cols, _native
+    _native = native
+    _rows = np.load(shared_dir + os.sep + ROWS_FILE, mmap_mode="r")
+    _cols = np.load(shared_dir + os.sep + COLS_FILE, mmap_mode="r")
+
+
+def _decode(file: Union[str, BinaryIO]) -> List[Result]:
+    started = time.perf_counter()
+    try:
+        data, metadata = read_composite(file, native=_native)
+    except (OSError, ValueError) as e:
+        logger.warning(str(e) + " Skipping file " + str(getattr(file, "name", file)) +
+                       "! This is most likely caused by invalid DWD data")
+        return [(None, time.perf_counter() - started, 0.0)]
+    decoded = time.perf_counter()
+    if isinstance(file, str):
+        os.remove(file)
+    values = np.round(data[_rows, _cols], 2)
+    positions = np.flatnonzero(values != metadata['nodataflag'])
+    metadata = {key: metadata[key] for key in ('datetime', 'precision', 'nodataflag', 'producttype')
+                if key in metadata}
+    return [((metadata, positions.astype(np.int32), values[positions]), decoded - started,
+             time.perf_counter() - decoded)]
+
+
+class DecodePool:
+    def __init__(self, rows: np.ndarray, cols: np.ndarray, processes: int, native: bool = True):
+        '''
+        Pool of processes decoding radolan composites and applying the mask. The masked cell indices are written
+        to /dev/shm if available and memory-mapped by all workers, so they share the same pages. Workers are not forked
+        from the importing process, which runs download and publishing threads whose locks a fork could copy while held.
+
+        :param rows: row indices of the masked cells, see GridExtractor
+        :param cols: column indices of the masked cells, see GridExtractor
+        :param processes: number of worker processes
+        :param native: decode with the native decoder, see Decoder.read_composite
+        '''
+        shm = os.sep + "dev" + os.sep + "shm"
+        self.__shared_dir = tempfile.mkdtemp(prefix="radolan-decode-", dir=shm if os.path.isdir(shm) else None)
+        np.save(self.__shared_dir + os.sep + ROWS_FILE, np.ascontiguousarray(rows))
+        np.save(self.__shared_dir + os.sep + COLS_FILE, np.ascontiguousarray(cols))
+        self.__processes = processes
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.__executor = ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker,
+                                              initargs=(self.__shared_dir, native))
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        return self.__executor
+
+    @property
+    def window(self) -> int:
+        '''
+        :return: Number of files decoded ahead of publishing
+        '''
+        return 2 * self.__processes
+
+    @staticmethod
+    def decode(file: Union[str, BinaryIO]) -> List[Result]:
+        '''
+        Runs in the worker processes. Decodes a file, which is removed afterwards if given by name.
+
+        :param file: local filename or an uncompressed file object
+        :return: List with a single (selection, decode seconds, mask seconds). The selection is (metadata, positions
+         within the masked cells, rounded values) or None, if the file could not be decoded.
+        '''
+        return _decode(file)
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=True)
+        shutil.rmtree(self.__shared_dir, ignore_errors=True)
@@ -0,0 +1,155 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import gzip
+import io
+from datetime import datetime
+from typing import BinaryIO, Dict, Tuple, Union
+
+import numpy as np
+import wradlib
+from import_lib.import_lib import get_logger
+
+logger = get_logger(__name__)
+
+SUPPORTED_PRODUCTS = ("SF", "RW")
+NODATA = -9999
+
+ETX = b"\x03"
+GZIP_MAGIC = b"\x1f\x8b"
+VALUE_MASK = 0x0FFF
+SECONDARY_FLAG = 0x1000
+NODATA_FLAG = 0x2000
+CLUTTER_FLAG = 0x8000
+
+# Header tokens as defined by DWD, the value of a token reaches up to the next token
+_TOKENS = ("BY", "VS", "SW", "PR", "INT", "GP", "MS", "LV", "CS", "MH", "VV", "MF", "QN", "VR", "U", "ST")
+_MAX_RANGES = {0: "100 km and 128 km (mixed)", 1: "100 km", 2: "128 km", 3: "150 km"}
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def parse_header(header: str) -> Dict:
+    '''
+    Parses the ASCII header of a SF or RW composite into the same attributes wradlib returns
+
+    :param header: header without the terminating ETX
+    :return: dict of attributes
+    :except UnsupportedFormat: if the product is not supported or a required token is missing
+    '''
+    product = header[0:2]
+    if product not in SUPPORTED_PRODUCTS:
+        raise UnsupportedFormat("Unsupported product " + product)
+    positions = sorted((header.find(token), token) for token in _TOKENS if header.find(token) > -1)
+    values = {}
+    for n, (position, token) in enumerate(positions):
+        end = positions[n + 1][0] if n + 1 < len(positions) else len(header)
+        values[token] = header[position + len(token):end]
+    for token in ("BY", "PR", "INT", "GP"):
+        if token not in values:
+            raise UnsupportedFormat("Missing " + token + " in header")
+    try:
+        attrs = {
+            "producttype": product,
+            "datetime": datetime.strptime(header[2:8] + header[13:17], "%d%H%M%m%y"),
+            "radarid": header[8:13],
+            "datasize": int(values["BY"]) - len(header) - 1,
+            "precision": float("1" + values["PR"].strip()),
+            "intervalseconds": int(values["INT"]) * 60,
+        }
+        rows, cols = values["GP"].strip().split("x")
+        attrs["nrow"] = int(rows)
+        attrs["ncol"] = int(cols)
+        if "VS" in values:
+            attrs["maxrange"] = _MAX_RANGES.get(int(values["VS"]), "100 km")
+        if "SW" in values:
+            attrs["radolanversion"] = values["SW"].strip()
+        if "MS" in values:
+            attrs["radarlocations"] = header[header.find("MS"):].split("<")[1].split(">")[0].split(",")
+    except (ValueError, IndexError) as e:
+        raise UnsupportedFormat("Invalid header: " + str(e))
+    return attrs
+
+
+def decode(content: Union[bytes, bytearray, memoryview], missing: float = NODATA) -> Tuple[np.ndarray, Dict]:
+    '''
+    Decodes an uncompressed SF or RW composite. The payload is mapped without copying, flags and precision are applied
+    in a single vectorized pass.
+
+    :param content: file content
+    :param missing: value of cells without data
+    :return: Tuple of (data, attributes) like wradlib.io.read_radolan_composite
+    :except UnsupportedFormat: if the file is not a supported composite
+    '''
+    content = memoryview(content).cast("B")
+    end = bytes(content[:1024]).find(ETX)
+    if end < 0:
+        raise UnsupportedFormat("Header is not terminated")
+    attrs = parse_header(bytes(content[:end]).decode("ascii", errors="replace"))
+    attrs["nodataflag"] = missing
+    cells = attrs["nrow"] * attrs["ncol"]
+    if len(content) - end - 1 < cells * 2:
+        raise UnsupportedFormat("Unexpected payload size")
+    raw = np.frombuffer(content, dtype="<u2", count=cells, offset=end + 1)
+    # All flags are above the value bits, so only the few flagged cells are searched for the single flags
+    flagged = np.flatnonzero(raw > VALUE_MASK)
+    flags = raw[flagged]
+    attrs["secondary"] = flagged[(flags & SECONDARY_FLAG) != 0]
+    nodata = flagged[(flags & NODATA_FLAG) != 0]
+    attrs["nodatamask"] = nodata
+    attrs["cluttermask"] = flagged[(flags & CLUTTER_FLAG) != 0]
+    data = (raw & VALUE_MASK) * attrs["precision"]
+    data[nodata] = missing
+    return data.reshape((attrs["nrow"], attrs["ncol"])), attrs
+
+
+def read_radolan_composite(file: Union[str, BinaryIO], missing: float = NODATA) -> Tuple[np.ndarray, Dict]:
+    '''
+    Reads a SF or RW composite with the native decoder. Gzipped content is detected and decompressed in memory.
+
+    :param file: local filename or a file object
+    :param missing: value of cells without data
+    :return: Tuple of (data, attributes) like wradlib.io.read_radolan_composite
+    :except UnsupportedFormat: if the file is not a supported composite
+    '''
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            content = f.read()
+    elif isinstance(file, io.BytesIO):
+        content = file.getbuffer()
+    else:
+        content = file.read()
+    if bytes(content[:2]) == GZIP_MAGIC:
+        content = gzip.decompress(content)
+    return decode(content, missing)
+
+
+def read_composite(file: Union[str, BinaryIO], native: bool = True) -> Tuple[np.ndarray, Dict]:
+    '''
+    Reads a composite with the native decoder, files it does not support are read with wradlib
+
+    :param file: local filename or an uncompressed file object
+    :param native: use the native decoder, else always wradlib
+    :return: Tuple of (data, attributes)
+    '''
+    if native:
+        try:
+            return read_radolan_composite(file)
+        except UnsupportedFormat as e:
+            logger.debug("Decoding " + str(getattr(file, "name", file)) + " with wradlib: " + str(e))
+            if not isinstance(file, str):
+                file.seek(0)
+    return wradlib.io.read_radolan_composite(file)
@@ -0,0 +1,52 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from typing import Tuple
+
+import numpy as np
+
+
+class DeltaFilter:
+    def __init__(self, cells: int, keyframe_interval: int = 24):
+        '''
+        Reduces consecutive frames to the cells whose value changed. Every keyframe_interval frames a full keyframe is
+        passed on, so consumers that missed messages or started late catch up. Cells that lose their value are not
+        reported, since there is no message for missing data.
+
+        :param cells: number of masked cells
+        :param keyframe_interval: number of frames between keyframes, the first frame is always a keyframe
+        '''
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be at least 1")
+        self.__previous = np.full(cells, np.nan)
+        self.__keyframe_interval = keyframe_interval
+        self.__frames_since_keyframe = None
+
+    def filter(self, positions: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        :param positions: positions within the masked cells as returned by GridExtractor.select
+        :param values: rounded values of these cells
+        :return: Tuple of (positions, values) to publish
+        '''
+        keyframe = self.__frames_since_keyframe is None or self.__frames_since_keyframe + 1 >= self.__keyframe_interval
+        if keyframe:
+            self.__frames_since_keyframe = 0
+            changed = slice(None)
+        else:
+            self.__frames_since_keyframe += 1
+            changed = self.__previous[positions] != values
+
+        self.__previous.fill(np.nan)
+        self.__previous[positions] = values
+        return positions[changed], values[changed]
@@ -0,0 +1,163 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import posixpath
+import re
+import threading
+import time
+from ftplib import FTP, all_errors
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote
+
+import requests
+from import_lib.import_lib import get_logger
+
+from radolan_lib.util.metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+_LISTING_SECONDS = REGISTRY.timer("radolan_listing_seconds", "Duration of remote directory listings")
+_LISTING_FAILURES = REGISTRY.counter("radolan_listing_failures_total", "Remote directory listings that failed")
+
+_HREF = re.compile(r'href="([^"?/]+)"')
+
+
+class DirectoryLister:
+    def __init__(self, host: str, ttl: float = 300, timeout: float = 60, base_url: str = None):
+        '''
+        Lists remote directories. Listings are cached for ttl seconds and fetched over a persistent anonymous FTP
+        connection, which is reopened when it was closed by the server. If FTP fails, the HTTP index of the same
+        directory is used instead.
+
+        :param host: remote host, serving both FTP and HTTPS
+        :param ttl: seconds a listing is cached
+        :param timeout: network timeout in seconds
+        :param base_url: Optional URL of a HTTP mirror of host. Directories are only listed from its index then.
+        '''
+        self.__host = host
+        self.__base_url = base_url if base_url is not None else "https://" + host + "/"
+        self.__use_ftp = base_url is None
+        self.__ttl = ttl
+        self.__timeout = timeout
+        self.__client = None  # type: Optional[FTP]
+        self.__root = "/"
+        self.__cache = {}  # type: Dict[str, Tuple[float, List[str]]]
+        self.__seen = {}  # type: Dict[str, Set[str]]
+        self.__lock = threading.Lock()
+
+    def list(self, dir: str, suffix: str = None, max_age: float = None) -> List[str]:
+        '''
+        Lists the files of a remote directory
+
+        :param dir: remote directory
+        :param suffix: Optional filter for file endings
+        :param max_age: Optional override of the ttl, 0 forces a new listing
+        :return: sorted list of filenames. Empty if the directory could not be listed.
+        '''
+        max_age = self.__ttl if max_age is None else max_age
+        with self.__lock:
+            cached = self.__cache.get(dir)
+            if cached is not None and time.monotonic() - cached[0] < max_age:
+                files = cached[1]
+            else:
+                with _LISTING_SECONDS.time():
+                    files = self.__fetch(dir)
+                if files is None:
+                    _LISTING_FAILURES.inc()
+                    return []
+                files.sort()
+                self.__cache[dir] = (time.monotonic(), files)
+        if suffix is None:
+            return list(files)
+        return [f for f in files if f.endswith(suffix)]
+
+    def list_new(self, dir: str, suffix: str = None) -> Tuple[List[str], bool]:
+        '''
+        Lists the files of a remote directory that were not marked as seen with mark_seen. Files are returned again by
+        later calls until they are marked, so a failed import can be retried.
+
+        :param dir: remote directory
+        :param suffix: Optional filter for file endings
+        :return: Tuple of (sorted list of new filenames, True if this is the first listing of dir)
+        '''
+        files = self.list(dir, suffix)
+        with self.__lock:
+            first = dir not in self.__seen
+            if len(files) == 0:  # Failed listings don't count as previous listing
+                return [], first
+            seen = self.__seen.setdefault(dir, set())
+            return [f for f in files if f not in seen], first
+
+    def mark_seen(self, dir: str, files: List[str]) -> None:
+        '''
+        Excludes files from later results of list_new
+
+        :param dir: remote directory
+        :param files: filenames as returned by list_new
+        '''
+        with self.__lock:
+            self.__seen.setdefault(dir, set()).update(files)
+
+    def invalidate(self, dir: str = None) -> None:
+        '''
+        Drops cached listings
+
+        :param dir: Optional directory, all directories if None
+        '''
+        with self.__lock:
+            if dir is None:
+                self.__cache.clear()
+            else:
+                self.__cache.pop(dir, None)
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__disconnect()
+
+    def __fetch(self, dir: str) -> Optional[List[str]]:
+        if not self.__use_ftp:
+            return self.__fetch_http(dir)
+        for attempt in range(2):
+            try:
+                if self.__client is None:
+                    self.__client = FTP(self.__host, timeout=self.__timeout)
+                    self.__client.login()
+                    self.__root = self.__client.pwd()
+                self.__client.cwd(posixpath.join(self.__root, dir))
+                return [name.rsplit("/", 1)[-1] for name in self.__client.nlst()]
+            except all_errors as e:
+                self.__disconnect()
+                if attempt == 0:
+                    logger.debug("FTP listing of " + dir + " failed, reconnecting: " + str(e))
+                else:
+                    logger.warning("Could not fetch files from dir " + dir + " via FTP: " + str(e))
+        return self.__fetch_http(dir)
+
+    def __fetch_http(self, dir: str) -> Optional[List[str]]:
+        url = self.__base_url + dir.strip("/") + "/"
+        try:
+            with requests.get(url, timeout=self.__timeout) as r:
+                r.raise_for_status()
+                return sorted(set(unquote(name) for name in _HREF.findall(r.text)))
+        except requests.RequestException as e:
+            logger.warning("Could not fetch files from " + url + ": " + str(e))
+            return None
+
+    def __disconnect(self) -> None:
+        if self.__client is not None:
+            try:
+                self.__client.close()
+            except all_errors:
+                pass
+            self.__client = None
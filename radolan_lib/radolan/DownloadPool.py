@@ -0,0 +1,80 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class DownloadPool:
+    def __init__(self, workers: int = 4, prefetch: int = None):
+        '''
+        Bounded pool of download threads. Each thread reuses its own pooled HTTP session.
+
+        :param workers: Number of concurrent downloads
+        :param prefetch: Number of downloads started ahead of the consumer. Defaults to twice the number of workers
+        '''
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.__workers = workers
+        self.__prefetch = prefetch if prefetch is not None else 2 * workers
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="radolan-download")
+        self.__local = threading.local()
+
+    def session(self) -> requests.Session:
+        '''
+        :return: The HTTP session of the calling thread
+        '''
+        session = getattr(self.__local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self.__local.session = session
+        return session
+
+    def map_ordered(self, func: Callable[[T], R], items: Iterable[T], prefetch: int = None) -> Iterator[R]:
+        '''
+        Applies func to all items on the pool and yields the results in the order of items. At most prefetch calls
+        are started ahead of the consumer, so slow consumers don't cause unbounded downloads.
+
+        :param func: function to call, usually a download
+        :param items: items to call func with
+        :param prefetch: Optional override of the pools prefetch limit
+        :return: Iterator of results in the order of items
+        '''
+        limit = max(1, prefetch if prefetch is not None else self.__prefetch)
+        pending = deque()
+        items = iter(items)
+        try:
+            for item in items:
+                pending.append(self.__executor.submit(func, item))
+                if len(pending) >= limit:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=True)
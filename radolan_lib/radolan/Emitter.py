@@ -0,0 +1,146 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from import_lib.import_lib import ImportLib, get_logger
+
+logger = get_logger(__name__)
+
+Record = Tuple[datetime, Dict]
+
+
+class Sink(ABC):
+    '''
+    Receives batches of records from a BatchEmitter
+    '''
+
+    @abstractmethod
+    def put_batch(self, records: List[Record]) -> None:
+        pass
+
+
+class ImportLibSink(Sink):
+    def __init__(self, lib: ImportLib):
+        '''
+        Hands batches over to the import-lib, which takes care of delivery
+
+        :param lib: Instance of the import-lib
+        '''
+        self.__lib = lib
+
+    def put_batch(self, records: List[Record]) -> None:
+        put = self.__lib.put
+        for date_time, value in records:
+            put(date_time, value)
+
+
+class ListSink(Sink):
+    def __init__(self):
+        '''
+        Keeps all records in memory. Stand-in for the import-lib in tests and benchmarks
+        '''
+        self.records = []  # type: List[Record]
+        self.batches = 0
+
+    def put_batch(self, records: List[Record]) -> None:
+        self.records += records
+        self.batches += 1
+
+
+class RateLimitedSink(Sink):
+    def __init__(self, sink: Sink, rate: float):
+        '''
+        Passes batches on to another sink, but no more than rate records per second on average
+
+        :param sink: receiver of the batches
+        :param rate: records per second
+        '''
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.__sink = sink
+        self.__rate = rate
+        self.__next = time.monotonic()
+
+    def put_batch(self, records: List[Record]) -> None:
+        now = time.monotonic()
+        if self.__next > now:
+            time.sleep(self.__next - now)
+        self.__sink.put_batch(records)
+        # Idle time is not saved up, so bursts after pauses are limited to a single batch
+        self.__next = max(self.__next, now) + len(records) / self.__rate
+
+
+class BatchEmitter:
+    def __init__(self, sink: Sink, batch_size: int = 1000, linger: float = 1.0):
+        '''
+        Collects records and passes them to the sink in batches. A batch is sent once it is full, once its oldest
+        record waited longer than linger or when flush is called, e.g. at the end of each file.
+
+        :param sink: receiver of the batches
+        :param batch_size: maximum number of records per batch
+        :param linger: maximum number of seconds a record is held back
+        '''
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.__sink = sink
+        self.__batch_size = batch_size
+        self.__linger = linger
+        self.__batch = []  # type: List[Record]
+        self.__batch_started = None
+        self.emitted = 0
+
+    def put(self, date_time: datetime, value: Dict) -> None:
+        '''
+        Adds a single record
+
+        :param date_time: datetime of the record
+        :param value: message
+        '''
+        if len(self.__batch) == 0:
+            self.__batch_started = time.monotonic()
+        self.__batch.append((date_time, value))
+        if len(self.__batch) >= self.__batch_size or time.monotonic() - self.__batch_started >= self.__linger:
+            self.flush()
+
+    def put_all(self, date_time: datetime, values: Iterable[Dict]) -> int:
+        '''
+        Adds records that share a datetime, e.g. all points of one file
+
+        :param date_time: datetime of the records
+        :param values: messages
+        :return: number of records added
+        '''
+        count = 0
+        for value in values:
+            self.put(date_time, value)
+            count += 1
+        return count
+
+    def flush(self) -> None:
+        '''
+        Sends all pending records
+        '''
+        if len(self.__batch) == 0:
+            return
+        batch = self.__batch
+        self.__batch = []
+        self.__sink.put_batch(batch)
+        self.emitted += len(batch)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Published batch of " + str(len(batch)) + " records from " + str(batch[0][0]))
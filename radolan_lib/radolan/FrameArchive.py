@@ -0,0 +1,302 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from import_lib.import_lib import get_logger
+
+from radolan_lib.util.filenames import next_month
+
+logger = get_logger(__name__)
+
+META_FILE = "archive.json"
+TIMES_FILE = "times.npy"
+SLOT_SECONDS = 3600
+NODATA = -9999
+EMPTY = -1  # time of an empty slot
+OPEN_MONTHS = 2
+DEFAULT_PRECISION = 0.1
+
+_EPOCH = datetime(1970, 1, 1)
+
+Month = Tuple[int, int]
+Tile = Tuple[int, int]
+
+
+class FrameArchive:
+    def __init__(self, directory: str, product: str, shape: Tuple[int, int] = (900, 900), tile_size: int = 100,
+                 precision: float = None):
+        '''
+        Local archive of decoded frames of one product. Frames are chunked by month and by tiles of tile_size x
+        tile_size cells, each chunk is a .npy file of int16 values with one hourly slot per frame. Files are
+        preallocated sparse, slots without data don't use disk space. Only tiles with published cells are stored.
+        Values are stored as value / precision + 1, 0 means no data.
+
+        :param directory: Folder of the archive, a sub folder is used for each product
+        :param product: product name
+        :param shape: shape of the frames
+        :param tile_size: number of rows and columns of a tile
+        :param precision: precision the values are quantized with. Default: the precision of the first appended frame
+        '''
+        self.__dir = directory + os.sep + product
+        self.__product = product
+        os.makedirs(self.__dir, exist_ok=True)
+        meta = {"shape": list(shape), "tile_size": tile_size, "precision": precision, "slot_seconds": SLOT_SECONDS}
+        try:
+            with open(self.__dir + os.sep + META_FILE) as f:
+                stored = json.load(f)
+            if any(stored[key] != value for key, value in meta.items() if value is not None):
+                logger.warning("Archive " + self.__dir + " was created with " + str(stored) + ", using these settings")
+            meta = stored
+        except FileNotFoundError:
+            if precision is not None:
+                self.__write_meta(meta)
+        self.__shape = tuple(meta["shape"])  # type: Tuple[int, int]
+        self.__tile_size = meta["tile_size"]  # type: int
+        self.__precision = meta["precision"]  # type: Optional[float]
+        self.__lock = threading.Lock()
+        self.__open = OrderedDict()  # type: OrderedDict[Month, Tuple[np.memmap, Dict[Tile, np.memmap]]]
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.__shape
+
+    @property
+    def precision(self) -> Optional[float]:
+        '''
+        :return: precision the values are quantized with or None, if nothing was appended to a new archive yet
+        '''
+        return self.__precision
+
+    def append(self, date_time: datetime, rows: np.ndarray, cols: np.ndarray, values: np.ndarray,
+               precision: float = None) -> None:
+        '''
+        Stores a frame. Cells that are not given have no data. A frame with the same hour replaces the previous one.
+
+        :param date_time: timestamp of the frame
+        :param rows: row indices of the cells with data
+        :param cols: column indices of the cells with data
+        :param values: values of the cells
+        :param precision: precision of the values, used for the quantization of new archives
+        '''
+        month = (date_time.year, date_time.month)
+        slot = self.__slot(date_time)
+        with self.__lock:
+            if self.__precision is None:
+                self.__precision = precision if precision is not None else DEFAULT_PRECISION
+                self.__write_meta({"shape": list(self.__shape), "tile_size": self.__tile_size,
+                                   "precision": self.__precision, "slot_seconds": SLOT_SECONDS})
+        frame = np.zeros(self.__shape, dtype=np.int16)
+        frame[rows, cols] = np.round(np.asarray(values) / self.__precision) + 1
+        tile_ids = set(np.unique((np.asarray(rows) // self.__tile_size) * self.__tiles_per_row() +
+                                 np.asarray(cols) // self.__tile_size).tolist())
+        with self.__lock:
+            times, tiles = self.__get_month(month, create=True)
+            if times[slot] != EMPTY:
+                times[slot] = EMPTY
+                # Tiles without cells in the new frame would keep the values of the replaced one otherwise
+                for tile, chunk in tiles.items():
+                    if tile[0] * self.__tiles_per_row() + tile[1] not in tile_ids and chunk[slot].any():
+                        chunk[slot] = 0
+            for tile_id in tile_ids:
+                tile = divmod(tile_id, self.__tiles_per_row())
+                chunk = tiles.get(tile)
+                if chunk is None:
+                    chunk = self.__open_chunk(month, self.__tile_file(tile),
+                                              (self.__slots(month),) + self.__tile_shape(tile), np.int16, create=True)
+                    tiles[tile] = chunk
+                chunk[slot] = frame[self.__tile_slice(tile)]
+            # The time is written last, so readers never see a slot with incomplete data
+            times[slot] = int((date_time - _EPOCH).total_seconds())
+
+    def months(self) -> List[Month]:
+        '''
+        :return: (year, month) of all months with data in chronological order
+        '''
+        months = []
+        for name in os.listdir(self.__dir):
+            if len(name) == 6 and name.isdigit() and os.path.exists(self.__dir + os.sep + name + os.sep + TIMES_FILE):
+                months.append((int(name[0:4]), int(name[4:6])))
+        return sorted(months)
+
+    def times(self, start: datetime = None, end: datetime = None) -> List[datetime]:
+        '''
+        :param start: Optional first datetime to include
+        :param end: Optional first datetime to exclude
+        :return: timestamps of all stored frames in the range in chronological order
+        '''
+        return [date_time for _, _, date_time in self.__iter_slots(start, end)]
+
+    def iter_frames(self, start: datetime = None, end: datetime = None) -> Iterator[Tuple[np.ndarray, Dict]]:
+        '''
+        Reads stored frames in chronological order
+
+        :param start: Optional first datetime to include
+        :param end: Optional first datetime to exclude
+        :return: Iterator of (data, metadata) like decoded composites. Cells without data are set to the nodataflag.
+        '''
+        for month, slot, date_time in self.__iter_slots(start, end):
+            with self.__lock:
+                _, tiles = self.__get_month(month)
+                stored = np.zeros(self.__shape, dtype=np.int16)
+                for tile, chunk in tiles.items():
+                    stored[self.__tile_slice(tile)] = chunk[slot]
+            data = (stored - 1) * self.__precision
+            data[stored == 0] = NODATA
+            yield data, {"datetime": date_time, "precision": self.__precision, "nodataflag": NODATA,
+                         "producttype": self.__product}
+
+    def read_cells(self, rows: np.ndarray, cols: np.ndarray, start: datetime = None,
+                   end: datetime = None) -> Tuple[List[datetime], np.ndarray]:
+        '''
+        Reads the time series of single cells. Only the slots and tiles of these cells are read from the memory-mapped
+        chunks.
+
+        :param rows: row indices of the cells
+        :param cols: column indices of the cells
+        :param start: Optional first datetime to include
+        :param end: Optional first datetime to exclude
+        :return: Tuple of (timestamps, values of shape (timestamps, cells)). Cells without data are NaN.
+        '''
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        tile_ids = (rows // self.__tile_size) * self.__tiles_per_row() + cols // self.__tile_size
+        slots = {}  # type: Dict[Month, List[int]]
+        times = []
+        for month, slot, date_time in self.__iter_slots(start, end):
+            slots.setdefault(month, []).append(slot)
+            times.append(date_time)
+        stored = np.zeros((len(times), len(rows)), dtype=np.int16)
+        offset = 0
+        for month, month_slots in slots.items():
+            with self.__lock:
+                _, tiles = self.__get_month(month)
+                for tile_id in np.unique(tile_ids).tolist():
+                    chunk = tiles.get(divmod(tile_id, self.__tiles_per_row()))
+                    if chunk is None:
+                        continue
+                    cells = np.flatnonzero(tile_ids == tile_id)
+                    stored[offset:offset + len(month_slots), cells] = \
+                        chunk[month_slots][:, rows[cells] % self.__tile_size, cols[cells] % self.__tile_size]
+            offset += len(month_slots)
+        values = (stored - 1) * self.__precision
+        values[stored == 0] = np.nan
+        return times, values
+
+    def flush(self) -> None:
+        '''
+        Writes changes of the open chunks to disk
+        '''
+        with self.__lock:
+            for times, tiles in self.__open.values():
+                times.flush()
+                for chunk in tiles.values():
+                    chunk.flush()
+
+    def close(self) -> None:
+        self.flush()
+        with self.__lock:
+            self.__open.clear()
+
+    def __iter_slots(self, start: Optional[datetime], end: Optional[datetime]) -> Iterator[Tuple[Month, int, datetime]]:
+        for month in self.months():
+            begin = datetime(month[0], month[1], 1)
+            if (start is not None and next_month(begin) <= start) or (end is not None and begin >= end):
+                continue
+            with self.__lock:
+                times, _ = self.__get_month(month)
+                filled = np.flatnonzero(times != EMPTY)
+                seconds = times[filled].tolist()
+            for slot, second in zip(filled.tolist(), seconds):
+                date_time = _EPOCH + timedelta(seconds=second)
+                if (start is None or date_time >= start) and (end is None or date_time < end):
+                    yield month, slot, date_time
+
+    def __get_month(self, month: Month, create: bool = False) -> Tuple[np.memmap, Dict[Tile, np.memmap]]:
+        opened = self.__open.get(month)
+        if opened is not None:
+            self.__open.move_to_end(month)
+            return opened
+        times = self.__open_chunk(month, TIMES_FILE, (self.__slots(month),), np.int64, create=create, fill=EMPTY)
+        tiles = {}
+        directory = self.__month_dir(month)
+        for name in os.listdir(directory):
+            if name.startswith("tile_") and name.endswith(".npy"):
+                tile = tuple(int(part) for part in name[5:-4].split("_"))
+                tiles[tile] = self.__open_chunk(month, name, None, np.int16)
+        self.__open[month] = (times, tiles)
+        while len(self.__open) > OPEN_MONTHS:
+            _, (old_times, old_tiles) = self.__open.popitem(last=False)
+            old_times.flush()
+            for chunk in old_tiles.values():
+                chunk.flush()
+        return times, tiles
+
+    def __open_chunk(self, month: Month, name: str, shape: Optional[Tuple[int, ...]], dtype, create: bool = False,
+                     fill: int = 0) -> np.memmap:
+        file = self.__month_dir(month) + os.sep + name
+        if create and not os.path.exists(file):
+            os.makedirs(self.__month_dir(month), exist_ok=True)
+            tmp = file + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+            chunk = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+            if fill != 0:
+                chunk[:] = fill
+            chunk.flush()
+            del chunk
+            try:
+                # Never replaces a chunk another process created in the meantime
+                os.link(tmp, file)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp)
+        return np.load(file, mmap_mode="r+")
+
+    def __month_dir(self, month: Month) -> str:
+        return self.__dir + os.sep + str(month[0]) + str(month[1]).zfill(2)
+
+    def __slot(self, date_time: datetime) -> int:
+        return int((date_time - datetime(date_time.year, date_time.month, 1)).total_seconds()) // SLOT_SECONDS
+
+    @staticmethod
+    def __slots(month: Month) -> int:
+        begin = datetime(month[0], month[1], 1)
+        return int((next_month(begin) - begin).total_seconds()) // SLOT_SECONDS
+
+    def __tiles_per_row(self) -> int:
+        return -(-self.__shape[1] // self.__tile_size)
+
+    def __tile_slice(self, tile: Tile) -> Tuple[slice, slice]:
+        return (slice(tile[0] * self.__tile_size, (tile[0] + 1) * self.__tile_size),
+                slice(tile[1] * self.__tile_size, (tile[1] + 1) * self.__tile_size))
+
+    def __tile_shape(self, tile: Tile) -> Tuple[int, int]:
+        rows, cols = self.__tile_slice(tile)
+        return (min(rows.stop, self.__shape[0]) - rows.start, min(cols.stop, self.__shape[1]) - cols.start)
+
+    @staticmethod
+    def __tile_file(tile: Tile) -> str:
+        return "tile_" + str(tile[0]) + "_" + str(tile[1]) + ".npy"
+
+    def __write_meta(self, meta: Dict) -> None:
+        tmp = self.__dir + os.sep + META_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.__dir + os.sep + META_FILE)
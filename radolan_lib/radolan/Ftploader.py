@@ -12,28 +12,57 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import gzip
+import hashlib
+import io
 import os
 import tarfile
+from contextlib import nullcontext
 from datetime import datetime
-from ftplib import FTP
-from typing import List, Union, Callable, Type
+from typing import List, Union, Callable, Type, Iterator, BinaryIO, Tuple, Optional
+from urllib.parse import urlparse
 from import_lib.import_lib import get_logger
 
 import requests
 
+from radolan_lib.radolan.DirectoryLister import DirectoryLister
+from radolan_lib.radolan.DownloadPool import DownloadPool
+from radolan_lib.radolan.Manifest import Manifest, STATUS_DOWNLOADING, STATUS_DOWNLOADED, STATUS_IMPORTED
 from radolan_lib.radolan.Products import Product, RW, SF, is_known_product
-from radolan_lib.util.strings import remove_prefix, remove_suffix
+from radolan_lib.util.filenames import FileIndex, month_start, needs_import, next_month, parse_filename
+from radolan_lib.util.limits import HostLimiter
+from radolan_lib.util.metrics import REGISTRY
 
 logger = get_logger(__name__)
 
+_DOWNLOAD_BYTES = REGISTRY.counter("radolan_download_bytes_total", "Bytes downloaded from the remote host")
+_DOWNLOAD_SECONDS = REGISTRY.timer("radolan_download_seconds", "Duration of file downloads")
+_EXTRACT_SECONDS = REGISTRY.timer("radolan_extract_seconds", "Duration of reading files from downloaded archives")
+_FILES_SKIPPED = REGISTRY.counter("radolan_files_skipped_total",
+                                  "Files not downloaded or imported, because that happened before")
+
 DWD_HOST = "opendata.dwd.de"
+TAR_PREFETCH = 2
+MANIFEST_FILE = "manifest.sqlite"
+REQUEST_TIMEOUT = 60  # seconds to connect and between received bytes
 
 
 class FtpLoader:
-    def __init__(self, product: Type[Product], datadir: str = os.sep + 'tmp' + os.sep + 'radolan'):
+    def __init__(self, product: Type[Product], datadir: str = os.sep + 'tmp' + os.sep + 'radolan',
+                 download_workers: int = 4, listing_ttl: float = 300, base_url: str = None,
+                 limiter: HostLimiter = None):
+        '''
+        :param product: A radolan product
+        :param datadir: Folder to download to
+        :param download_workers: Number of concurrent downloads during backfills
+        :param listing_ttl: Seconds remote directory listings are cached
+        :param base_url: Optional URL of a HTTP mirror of the DWD open data server, e.g. for offline benchmarks
+        :param limiter: Optional limit of concurrent requests to the remote host, which may be shared by many loaders
+        '''
         if not os.path.exists(datadir):
-            os.mkdir(datadir)
+            os.makedirs(datadir)
         self.__datadir = datadir
+        self.__manifest = Manifest(datadir + os.sep + MANIFEST_FILE)
         if not is_known_product(product):
             raise ValueError("Unknown product")
         if product == SF:
@@ -43,8 +72,28 @@ class FtpLoader:
             self.__DWD_RECENT_PATH = "climate_environment/CDC/grids_germany/hourly/radolan/recent/bin/"
             self.__DWD_HISTORICAL_PATH = "climate_environment/CDC/grids_germany/hourly/radolan/historical/bin/"
 
-        self.__DWD_RECENT_URL = "https://" + DWD_HOST + "/" + self.__DWD_RECENT_PATH
-        self.__DWD_HISTORICAL_URL = "https://" + DWD_HOST + "/" + self.__DWD_HISTORICAL_PATH
+        self.__lister = DirectoryLister(DWD_HOST, ttl=listing_ttl, base_url=base_url)
+        if base_url is None:
+            base_url = "https://" + DWD_HOST + "/"
+        self.__host = urlparse(base_url).netloc
+        self.__DWD_RECENT_URL = base_url + self.__DWD_RECENT_PATH
+        self.__DWD_HISTORICAL_URL = base_url + self.__DWD_HISTORICAL_PATH
+        self.__pool = DownloadPool(workers=download_workers)
+        self.__limiter = limiter
+
+    @property
+    def host(self) -> str:
+        '''
+        :return: The remote host files are downloaded from
+        '''
+        return self.__host
+
+    def newest_remote(self) -> Optional[datetime]:
+        '''
+        Uses the cached listing of recent files, so this doesn't cause additional requests in most cases
+        :return: Datetime of the newest file on the remote host or None, if unknown
+        '''
+        return FileIndex(self.__get_recent_list()).newest()
 
     def download_latest(self) -> str:
         '''
@@ -55,6 +104,38 @@ class FtpLoader:
         file = files[len(files) - 1]
         return self.__download_recent(self.__datadir, file, self.__DWD_RECENT_URL)
 
+    def download_new(self) -> List[str]:
+        '''
+        Downloads all radolan files, which were published since the first call and not marked as imported with
+        mark_new_imported. The first successful listing only downloads the latest file. Files that could not be
+        downloaded are skipped and downloaded again by the next call.
+        :return: Local filenames in chronological order
+        '''
+        files, first = self.__lister.list_new(self.__DWD_RECENT_PATH, "bin.gz")
+        if len(files) == 0:  # Also a failed first listing, which must not mark anything as seen
+            return []
+        if first:
+            self.__lister.mark_seen(self.__DWD_RECENT_PATH, files[:-1])
+            files = files[-1:]
+        downloaded = []
+        for file in files:
+            try:
+                downloaded.append(self.__download_recent(self.__datadir, file, self.__DWD_RECENT_URL,
+                                                         self.__pool.session()))
+            except (requests.RequestException, OSError) as e:
+                logger.error("Could not download " + file + ", retrying with the next call: " + str(e))
+        return downloaded
+
+    def mark_new_imported(self, local_file: str, imported: bool = True) -> None:
+        '''
+        Excludes a file returned by download_new from later calls of download_new
+        :param local_file: local filename as returned by download_new
+        :param imported: Also mark the file as imported in the manifest. False for files that can't be imported.
+        '''
+        self.__lister.mark_seen(self.__DWD_RECENT_PATH, [os.path.basename(local_file)])
+        if imported:
+            self.__mark_imported(local_file)
+
     def download_from_year(self, year: int, max_files: int = None, callback: Callable[[List[str]], any] = None,
                            start: datetime = None) -> Union[List[str], None]:
         '''
@@ -70,30 +151,82 @@ class FtpLoader:
         :return: List of all files downloaded, if no callback function provided. None, if the callback function received
          the files.
         '''
+        files = []
+        for archive in self.iter_downloads(year, max_files=max_files, start=start):
+            extracted = self.extract_archive(archive, start=start)
+            if callback is not None:
+                callback(extracted)
+            else:
+                files += extracted
+
+        if callback is not None:
+            return None
+        files.sort()
+        return files
+
+    def iter_downloads(self, year: int, max_files: int = None, start: datetime = None) -> Iterator[str]:
+        '''
+        Downloads all archives of a given year. Downloads run concurrently, but the local files are yielded in
+        chronological order. These are monthly tar.gz files for past years and bin.gz files for the current year.
+
+        :param year: Year to download data from
+        :param max_files: Upper limit to number of monthly archives downloaded. This is a debugging feature
+        :param start: Optional date restriction. Will not download files with data before this datetime
+        :return: Iterator of local filenames
+        '''
         if year == datetime.now().year:
-            return self.__download_recents(callback, start)
+            yield from self.__download_recents(start)
+            return
         tarnames = self.__get_files_of_dir(self.__DWD_HISTORICAL_PATH + str(year), "tar.gz")
         if max_files is not None:
             tarnames = tarnames[0:max_files]
-        tarnames_filtered = []
-        for tarname in tarnames:
-            stripped = remove_suffix(tarname, ".tar.gz")
-            stripped = remove_prefix(stripped, "SF")
-            stripped = remove_prefix(stripped, "RW")
-            stripped = remove_prefix(stripped, "-")
-            stripped = remove_prefix(stripped, str(year))
-            month = int(stripped)
-            if start is not None and month < start.month:
-                logger.debug("Skipping download for month " + str(month) + " (already imported)")
-                continue
-            tarnames_filtered.append(tarname)
-        files = []
-        for tarname in tarnames_filtered:
-            targz = self.__download_file(self.__datadir + os.sep + tarname,
-                                  self.__DWD_HISTORICAL_URL + str(year) + "/" + tarname)
-            tar = tarfile.open(targz, "r:gz")
+        tarnames_filtered = self.__filter_index(FileIndex(tarnames), month_start(start) if start is not None else None)
+        # Monthly tars are large, so only a few are downloaded ahead of extraction
+        yield from self.__pool.map_ordered(
+            lambda tarname: self.__download_file(self.__datadir + os.sep + tarname,
+                                                 self.__DWD_HISTORICAL_URL + str(year) + "/" + tarname,
+                                                 self.__pool.session()),
+            tarnames_filtered, prefetch=TAR_PREFETCH)
+
+    def download_month(self, year: int, month: int, start: datetime = None) -> List[str]:
+        '''
+        Downloads the data of a single month. These are the monthly tar.gz file for past years and bin.gz files for
+        the current year. The many files of the current year are downloaded concurrently.
 
-            logger.info("Extracting local file " + targz)
+        :param year: Year to download data from
+        :param month: Month to download data from
+        :param start: Optional date restriction. Will not download files with data before this datetime
+        :return: Local filenames in chronological order. Empty, if no data is available for this month.
+        '''
+        begin = datetime(year, month, 1)
+        end = next_month(begin)
+        if start is not None and start > begin:
+            begin = start
+        if year == datetime.now().year:
+            names = FileIndex(self.__get_recent_list()).between(begin, end)
+            return list(self.__pool.map_ordered(
+                lambda name: self.__download_recent(self.__datadir, name, self.__DWD_RECENT_URL, self.__pool.session()),
+                names))
+        names = FileIndex(self.__get_files_of_dir(self.__DWD_HISTORICAL_PATH + str(year), "tar.gz")) \
+            .between(month_start(begin), end)
+        return [self.__download_file(self.__datadir + os.sep + name, self.__DWD_HISTORICAL_URL + str(year) + "/" + name,
+                                     self.__pool.session())
+                for name in names]
+
+    def extract_archive(self, archive: str, start: datetime = None) -> List[str]:
+        '''
+        Extracts a downloaded monthly tar.gz into the data dir and removes it. Other files are returned unmodified.
+
+        :param archive: local filename as yielded by iter_downloads
+        :param start: Optional date restriction. Files with data before this datetime will not be returned
+        :return: Sorted list of local radolan files
+        '''
+        if not archive.endswith(".tar.gz"):
+            return [archive]
+        tar = tarfile.open(archive, "r:gz")
+
+        logger.info("Extracting local file " + archive)
+        with _EXTRACT_SECONDS.time():
             tar.extractall(path=self.__datadir)
             names = tar.getnames()
             if len(names) == 1:  # Packed tar in tar.gz, this exists (e.g. first file of 2007)
@@ -102,114 +235,254 @@ class FtpLoader:
                 names = tarx.getnames()
                 os.remove(self.__datadir + os.sep + tar.getnames()[0])
 
-            for name in names:
-                if start is not None:
-                    if not self.__file_needs_import(start, name):
-                        logger.debug("Skipping file (already imported): " + name)
-                        continue
-                files.append(self.__datadir + os.sep + name)
-            os.remove(targz)
-            if callback is not None:
-                files.sort()
-                callback(files)
-                files = []
-
-        if callback is not None:
-            return None
-        files.sort()
+        files = [self.__datadir + os.sep + name for name in self.__filter_index(FileIndex(names), start)]
+        os.remove(archive)
+        self.__mark_imported(archive)
         return files
 
-    def __download_recents(self, callback: Callable[[List[str]], any] = None, start: datetime = None) -> Union[
-        List[str], None]:
+    def iter_archive_members(self, archive: str, start: datetime = None, end: datetime = None,
+                             remove: bool = True) -> Iterator[BinaryIO]:
+        '''
+        Reads the radolan files of a downloaded archive into memory without extracting them to disk. Nested tars are
+        read as a stream as well and gzipped files are decompressed in memory. The archive is removed afterwards.
+
+        :param archive: local filename as yielded by iter_downloads
+        :param start: Optional date restriction. Files with data before this datetime will be skipped
+        :param end: Optional date restriction. Files with data from this datetime on will be skipped
+        :param remove: Remove the archive and mark it as imported. Otherwise the archive is left untouched
+        :return: Iterator of in-memory file objects. Their name attribute holds the original filename.
+        '''
+        if archive.endswith(".tar.gz") or archive.endswith(".tar"):
+            logger.info("Streaming local file " + archive)
+            with tarfile.open(archive, "r|*") as tar:
+                yield from self.__iter_tar(tar, start, end)
+        elif needs_import(archive, start) and not self.__is_after(archive, end):
+            with open(archive, "rb") as f:
+                yield self.__to_fileobj(os.path.basename(archive), f.read())
+        if remove:
+            os.remove(archive)
+            self.__mark_imported(archive)
+
+    @staticmethod
+    def __is_after(name: str, end: Optional[datetime]) -> bool:
+        if end is None:
+            return False
+        parsed = parse_filename(name)
+        return parsed is not None and parsed.timestamp >= end
+
+    def __iter_tar(self, tar: tarfile.TarFile, start: datetime = None, end: datetime = None) -> Iterator[BinaryIO]:
+        previous = None
+        for member in tar:
+            if not member.isfile():
+                continue
+            name = os.path.basename(member.name)
+            f = tar.extractfile(member)
+            if name.endswith(".tar"):  # Packed tar in tar.gz, this exists (e.g. first file of 2007)
+                with tarfile.open(fileobj=f, mode="r|") as tarx:
+                    yield from self.__iter_tar(tarx, start, end)
+                continue
+            if not needs_import(name, start):
+                logger.debug("Skipping file (already imported): " + name)
+                _FILES_SKIPPED.inc()
+                continue
+            if self.__is_after(name, end):
+                continue
+            parsed = parse_filename(name)
+            if parsed is not None:
+                if previous is not None and parsed.timestamp < previous.timestamp:
+                    logger.warning("Archive is not sorted, " + name + " is imported after data of " +
+                                   str(previous.timestamp))
+                previous = parsed
+            with _EXTRACT_SECONDS.time():
+                fileobj = self.__to_fileobj(name, f.read())
+            yield fileobj
+
+    @staticmethod
+    def __to_fileobj(name: str, content: bytes) -> BinaryIO:
+        if name.endswith(".gz"):
+            content = gzip.decompress(content)
+        f = io.BytesIO(content)
+        f.name = name
+        return f
+
+    def __download_recents(self, start: datetime = None) -> Iterator[str]:
         files = self.__get_recent_list()
-        filenames = []
-        for f in files:
-            if start is not None:
-                if not self.__file_needs_import(start, f):
-                    logger.debug("Skipping file (already imported): " + f)
-                    continue
-
-            filename = self.__download_recent(self.__datadir, f, self.__DWD_RECENT_URL)
-            if callback is not None:
-                callback([filename])
-            filenames.append(filename)
-        if callback is not None:
-            return None
-        return files
+        needed = self.__filter_index(FileIndex(files), start)
+
+        return self.__pool.map_ordered(
+            lambda f: self.__download_recent(self.__datadir, f, self.__DWD_RECENT_URL, self.__pool.session()),
+            needed)
 
     def __get_recent_list(self) -> List[str]:
         return self.__get_files_of_dir(self.__DWD_RECENT_PATH, "bin.gz")
 
     def __get_files_of_dir(self, dir: str, suffix: str = None) -> List[str]:
-        client = FTP(DWD_HOST)
-        client.login()
-        try:
-            client.cwd(dir)
-            files = client.nlst()
-        except Exception:
-            logger.warning("Cloud not fetch files from dir "  + dir)
-            return []
-        finally:
-            client.close()
-        if suffix is None:
-            return files
-        filteredFiles = []
-        for f in files:
-            if f.endswith(suffix):
-                filteredFiles.append(f)
-        client.close()
-        filteredFiles.sort()
-        return filteredFiles
-
-    def __download_recent(self, localdir: str, file: str, remote_path: str) -> str:
+        return self.__lister.list(dir, suffix)
+
+    def __download_recent(self, localdir: str, file: str, remote_path: str,
+                          session: requests.Session = None) -> str:
         '''
         Downloads the recent radolan file into localdir if it doesn't already exist
         :param localdir: Folder to download to
         :param file: File to download
+        :param session: Optional HTTP session to reuse
         :return: Local filename
         '''
         remote_file = remote_path + file
         logger.debug("Downloading " + remote_file)
         local_file = localdir + os.sep + file
-        return self.__download_file(local_file=local_file, remote_file=remote_file)
+        return self.__download_file(local_file=local_file, remote_file=remote_file, session=session)
 
-    @staticmethod
-    def __download_file(local_file: str, remote_file: str) -> str:
+    def __download_file(self, local_file: str, remote_file: str, session: requests.Session = None) -> str:
         '''
-        Downloads file to dir, if file doesn't already exist
+        Downloads file to dir, if it wasn't completely downloaded before. Data is written to a .part file, which is
+        renamed once the download is complete and verified against the remote size. Interrupted downloads of the same
+        remote version are resumed with a HTTP Range request. Existing files are only reused, if they match the sha256
+        recorded in the manifest. The remote version is only requested separately for files in the manifest, new files
+        take it from the response of the download.
         :param local_file: File to save to
         :param remote_file: Remote file URL
+        :param session: Optional HTTP session to reuse
         :return: Local filename
         '''
+        http = session if session is not None else requests
+        name = os.path.basename(local_file)
+        entry = self.__manifest.get(name)
+        size, mtime = None, None
+        if entry is not None:  # Nothing to reuse or resume otherwise
+            with self.__limit():
+                size, mtime = self.__remote_stat(http, remote_file)
+        same_version = entry is not None and (size is None or entry["size"] == size) and \
+            (mtime is None or entry["mtime"] == mtime)
+
         if os.path.exists(local_file):
-            logger.info("File exists, skipping download: " + local_file)
-            return local_file
+            if same_version and entry["status"] != STATUS_DOWNLOADING and os.path.getsize(local_file) == entry["size"] \
+                    and (entry["sha256"] is None or self.__sha256(local_file).hexdigest() == entry["sha256"]):
+                logger.info("File exists, skipping download: " + local_file)
+                _FILES_SKIPPED.inc()
+                return local_file
+            logger.warning("Local file is incomplete or outdated, downloading again: " + local_file)
+            os.remove(local_file)
+
+        part_file = local_file + ".part"
+        offset = 0
+        if os.path.exists(part_file):
+            if same_version and size is not None and os.path.getsize(part_file) <= size:
+                offset = os.path.getsize(part_file)
+            else:
+                os.remove(part_file)
+        self.__manifest.record(name, remote_file, size, mtime, None, STATUS_DOWNLOADING)
+
+        sha256 = self.__sha256(part_file) if offset > 0 else hashlib.sha256()
+        if offset > 0 and offset == size:  # Interrupted after the last chunk was written
+            logger.info("Remote file " + remote_file + " was downloaded completely before")
+        else:
+            with self.__limit():
+                sha256, size, mtime = self.__request(http, name, remote_file, part_file, offset, sha256, size, mtime)
+
+        downloaded = os.path.getsize(part_file)
+        if size is not None and downloaded != size:
+            if downloaded > size:
+                os.remove(part_file)
+            raise OSError("Incomplete download of " + remote_file + ": " + str(downloaded) + " of " + str(size) +
+                          " bytes")
+        os.replace(part_file, local_file)
+        self.__manifest.record(name, remote_file, downloaded, mtime, sha256.hexdigest(), STATUS_DOWNLOADED)
+        return local_file
+
+    def __request(self, http, name: str, remote_file: str, part_file: str, offset: int, sha256, size: Optional[int],
+                  mtime: Optional[str]):
+        '''
+        Downloads the remote file into the part file, starting at offset. An unknown size and modification time are
+        taken from the response and recorded in the manifest before any data is written, so the download can be
+        resumed if it is interrupted.
+        :param sha256: hash of the first offset bytes of the part file
+        :param size: remote size in bytes, if known
+        :param mtime: remote modification time, if known
+        :return: Tuple of (hash of the part file, remote size, remote modification time)
+        '''
+        headers = {}
+        if offset > 0:
+            headers["Range"] = "bytes=" + str(offset) + "-"
+            logger.info("Resuming download of remote file " + remote_file + " at byte " + str(offset))
+        else:
+            logger.info("Downloading remote file " + remote_file)
 
-        logger.info("Downloading remote file " + remote_file)
-        with open(local_file, 'wb') as f:
-            with requests.get(remote_file, stream=True) as r:
+        with _DOWNLOAD_SECONDS.time(), http.get(remote_file, stream=True, headers=headers,
+                                                timeout=REQUEST_TIMEOUT) as r:
+            if offset > 0 and r.status_code == 416:  # Range starts at the end, the part file is complete
+                return sha256, size, mtime
+            r.raise_for_status()
+            mode = 'ab'
+            if offset > 0 and r.status_code != 206:  # Server ignored the range
+                mode = 'wb'
+                sha256 = hashlib.sha256()
+            if size is None or mtime is None:
+                size = size if size is not None else self.__response_size(r)
+                mtime = mtime if mtime is not None else r.headers.get("Last-Modified")
+                self.__manifest.record(name, remote_file, size, mtime, None, STATUS_DOWNLOADING)
+            with open(part_file, mode) as f:
                 for chunk in r.iter_content(chunk_size=16 * 1024):
                     f.write(chunk)
-        return local_file
+                    sha256.update(chunk)
+                    _DOWNLOAD_BYTES.inc(len(chunk))
+        return sha256, size, mtime
 
     @staticmethod
-    def __file_needs_import(start: datetime, f: str) -> bool:
-        if start is None:
-            return True
-        f_trimmed = remove_prefix(f, "raa01-")
-        f_trimmed = remove_prefix(f_trimmed, "sf")
-        f_trimmed = remove_prefix(f_trimmed, "rw")
-        f_trimmed = remove_prefix(f_trimmed, "_10000-")
-        f_trimmed = remove_suffix(f_trimmed, ".gz")
-        f_trimmed = remove_suffix(f_trimmed, "-dwd---bin")
+    def __response_size(r: requests.Response) -> Optional[int]:
+        '''
+        :return: size of the complete remote file in bytes as reported by a download response or None, if unknown
+        '''
         try:
-            dt_f = datetime.strptime(f_trimmed, "%y%m%d%H%M")
-            if dt_f < start:
-                return False
+            if r.status_code == 206:
+                total = r.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+                return int(total) if total != "*" else None
+            if "Content-Encoding" in r.headers:  # Content-Length is the encoded size
+                return None
+            length = r.headers.get("Content-Length")
+            return int(length) if length is not None else None
         except ValueError:
-            logger.error("Datetime of DWD filename could not be parsed. Format changed?"
-                         " Filename: " + f + ", Trim attempt: " + f_trimmed)
-        return True
+            return None
+
+    @staticmethod
+    def __sha256(file: str):
+        sha256 = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256
+
+    @staticmethod
+    def __remote_stat(http, remote_file: str) -> Tuple[Optional[int], Optional[str]]:
+        '''
+        :return: Tuple of (size, modification time) of the remote file, each None if unknown
+        '''
+        try:
+            with http.head(remote_file, allow_redirects=True, timeout=REQUEST_TIMEOUT) as r:
+                if r.status_code != 200:
+                    return None, None
+                size = r.headers.get("Content-Length")
+                return (int(size) if size is not None else None), r.headers.get("Last-Modified")
+        except (requests.RequestException, ValueError):
+            return None, None
+
+    def __limit(self):
+        if self.__limiter is None:
+            return nullcontext()
+        return self.__limiter.limit(self.__host)
+
+    def __mark_imported(self, archive: str) -> None:
+        self.__manifest.set_status(os.path.basename(archive), STATUS_IMPORTED)
+
+    @staticmethod
+    def __filter_index(index: FileIndex, start: Optional[datetime]) -> List[str]:
+        names = index.since(start)
+        for name in index.unparsed:
+            logger.error("Datetime of DWD filename could not be parsed. Format changed? Filename: " + name)
+        if len(names) < len(index):
+            logger.debug("Skipping " + str(len(index) - len(names)) + " files (already imported)")
+            _FILES_SKIPPED.inc(len(index) - len(names))
+        return names
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import json
+import os
+from typing import Any, List, Optional, Tuple, Type
+
+import numpy as np
+from import_lib.import_lib import get_logger
+
+from radolan_lib.radolan.Products import Product
+
+logger = get_logger(__name__)
+
+GRID_FILE = "grid.npy"
+TOP_RIGHT_FILE = "top_right.npy"
+MASK_FILE = "mask.npy"
+
+
+class GridCache:
+    def __init__(self, cachedir: str):
+        '''
+        Persistent cache of the reprojected grid, the top right corners and the mask. Arrays are stored as .npy files
+        and loaded memory-mapped, so several processes on one host share the same pages. Caching is disabled, if the
+        folder can't be created.
+
+        :param cachedir: Folder to store cache entries in
+        '''
+        self.__cachedir = cachedir  # type: Optional[str]
+        try:
+            os.makedirs(cachedir, exist_ok=True)
+        except OSError as e:
+            logger.warning("Could not create grid cache " + cachedir + ", caching is disabled: " + str(e))
+            self.__cachedir = None
+
+    @staticmethod
+    def get_key(product: Type[Product], dim_x: int, dim_y: int, epsg: int,
+                bboxes: Optional[List[List[float]]], areas: Any = None) -> str:
+        '''
+        Creates the cache key of a grid configuration
+
+        :param product: A radolan product
+        :param dim_x: grid rows
+        :param dim_y: grid columns
+        :param epsg: EPSG code of the reprojected grid
+        :param bboxes: bounding boxes of the mask
+        :param areas: Optional GeoJSON areas of the mask
+        :return: a unique key
+        '''
+        key = [product.__name__, dim_x, dim_y, epsg, bboxes]
+        if areas is not None:
+            key.append(areas)
+        config = json.dumps(key, sort_keys=True)
+        return hashlib.sha256(config.encode("utf-8")).hexdigest()[:32]
+
+    def load(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        '''
+        Loads a cache entry
+
+        :param key: key as created by get_key
+        :return: Tuple of read-only memory-mapped (grid, top_right, mask) or None, if the key is not cached
+        '''
+        if self.__cachedir is None:
+            return None
+        entry = self.__cachedir + os.sep + key
+        try:
+            return (np.load(entry + os.sep + GRID_FILE, mmap_mode="r"),
+                    np.load(entry + os.sep + TOP_RIGHT_FILE, mmap_mode="r"),
+                    np.load(entry + os.sep + MASK_FILE, mmap_mode="r"))
+        except (OSError, ValueError):
+            return None
+
+    def load_array(self, key: str, name: str) -> Optional[np.ndarray]:
+        '''
+        Loads an additional array of a cache entry
+
+        :param key: key as created by get_key
+        :param name: name of the array
+        :return: read-only memory-mapped array or None, if not cached
+        '''
+        if self.__cachedir is None:
+            return None
+        try:
+            return np.load(self.__cachedir + os.sep + key + os.sep + name + ".npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def store_array(self, key: str, name: str, array: np.ndarray) -> None:
+        '''
+        Stores an additional array of a cache entry, e.g. derived from the mask
+
+        :param key: key as created by get_key
+        :param name: name of the array
+        :param array: the array
+        '''
+        if self.__cachedir is None:
+            return
+        entry = self.__cachedir + os.sep + key
+        try:
+            os.makedirs(entry, exist_ok=True)
+            self.__write(entry + os.sep + name + ".npy", array)
+        except OSError as e:
+            logger.warning("Could not store grid cache " + entry + ": " + str(e))
+
+    @staticmethod
+    def __write(file: str, array: np.ndarray) -> None:
+        tmp = file + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(tmp, file)
+
+    def store(self, key: str, grid: np.ndarray, top_right: np.ndarray, mask: np.ndarray) -> None:
+        '''
+        Stores a cache entry. Each file is written to a temporary file first and renamed afterwards, so concurrent
+        processes never load partially written arrays. The mask is written last and marks a complete entry.
+
+        :param key: key as created by get_key
+        :param grid: reprojected grid
+        :param top_right: top right corners of the grid cells
+        :param mask: boolean mask
+        '''
+        if self.__cachedir is None:
+            return
+        entry = self.__cachedir + os.sep + key
+        try:
+            os.makedirs(entry, exist_ok=True)
+            for name, array in ((GRID_FILE, grid), (TOP_RIGHT_FILE, top_right), (MASK_FILE, mask)):
+                self.__write(entry + os.sep + name, array)
+        except OSError as e:
+            logger.warning("Could not store grid cache " + entry + ": " + str(e))
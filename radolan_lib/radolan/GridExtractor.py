@@ -0,0 +1,105 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from typing import Iterator, Tuple, Optional, List
+
+import numpy as np
+
+from radolan_lib.util.bbox import mask_to_indices
+
+Record = Tuple[float, float, Optional[float], Optional[float], float]
+
+
+def get_top_right(grid: np.ndarray) -> np.ndarray:
+    '''
+    Creates an array holding the top right corner of each grid cell. Cells on the upper or right edge have no top right
+    neighbour, their corners are NaN.
+    :param grid: A 3D ndarray of shape (dim_x, dim_y, 2) holding (long, lat) pairs
+    :return: ndarray of the same shape as grid
+    '''
+    top_right = np.full(grid.shape, np.nan, dtype=grid.dtype)
+    top_right[:-1, :-1] = grid[1:, 1:]
+    return top_right
+
+
+class GridExtractor:
+    def __init__(self, grid: np.ndarray, mask: np.ndarray, top_right: np.ndarray = None):
+        '''
+        Precomputes the coordinates of all masked cells, so a decoded frame can be reduced to points with a few array
+        operations
+
+        :param grid: A 3D ndarray of shape (dim_x, dim_y, 2) holding (long, lat) pairs
+        :param mask: A boolean mask of shape (dim_x, dim_y) as created by create_mask_array
+        :param top_right: Optional precomputed result of get_top_right
+        '''
+        if top_right is None:
+            top_right = get_top_right(grid)
+        self.__rows, self.__cols = mask_to_indices(mask)
+        self.__long = grid[self.__rows, self.__cols, 0]
+        self.__lat = grid[self.__rows, self.__cols, 1]
+        self.__long_top_right = top_right[self.__rows, self.__cols, 0]
+        self.__lat_top_right = top_right[self.__rows, self.__cols, 1]
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self.__rows
+
+    @property
+    def cols(self) -> np.ndarray:
+        return self.__cols
+
+    def __len__(self) -> int:
+        return len(self.__rows)
+
+    def select(self, data: np.ndarray, nodataflag: float) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Applies the mask to a decoded frame, rounds the values and drops cells without data
+
+        :param data: decoded frame of shape (dim_x, dim_y)
+        :param nodataflag: value of cells without data
+        :return: Tuple of (positions within the masked cells, rounded values)
+        '''
+        values = np.round(data[self.__rows, self.__cols], 2)
+        positions = np.flatnonzero(values != nodataflag)
+        return positions, values[positions]
+
+    def records(self, positions: np.ndarray, values: np.ndarray) -> Iterator[Record]:
+        '''
+        Gathers the coordinates of the selected cells
+
+        :param positions: positions within the masked cells as returned by select
+        :param values: values of these cells
+        :return: Iterator of (long, lat, long_top_right, lat_top_right, value)
+        '''
+        return zip(self.__long[positions].tolist(), self.__lat[positions].tolist(),
+                   self.__corner_list(self.__long_top_right[positions]),
+                   self.__corner_list(self.__lat_top_right[positions]),
+                   np.asarray(values).tolist())
+
+    def extract(self, data: np.ndarray, nodataflag: float) -> Iterator[Record]:
+        '''
+        Reduces a decoded frame to records of all masked cells with data
+
+        :param data: decoded frame of shape (dim_x, dim_y)
+        :param nodataflag: value of cells without data
+        :return: Iterator of (long, lat, long_top_right, lat_top_right, value)
+        '''
+        return self.records(*self.select(data, nodataflag))
+
+    @staticmethod
+    def __corner_list(corners: np.ndarray) -> List[Optional[float]]:
+        corner_list = corners.tolist()
+        for k in np.flatnonzero(np.isnan(corners)).tolist():
+            corner_list[k] = None
+        return corner_list
@@ -12,94 +12,380 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from datetime import datetime
-from typing import List, Tuple, Optional
+from collections import deque
+from datetime import datetime, timedelta
+from typing import List, Tuple, Optional, Dict
+
+import numpy as np
+
+AGGREGATIONS = ("sum", "max", "mean")
+
+
+def _check_method(method: str) -> None:
+    if method not in AGGREGATIONS:
+        raise ValueError("Unknown aggregation " + str(method) + ", expected one of " + str(AGGREGATIONS))
+
+
+def _reduce(values: np.ndarray, method: str) -> np.ndarray:
+    '''
+    Aggregates along the first axis ignoring NaN. Cells without any value are NaN.
+    '''
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    if method == "max":
+        result = np.max(np.where(valid, values, -np.inf), axis=0, initial=-np.inf).astype(np.float64)
+    else:
+        result = np.where(valid, values, 0).sum(axis=0, dtype=np.float64)
+        if method == "mean":
+            result = result / np.maximum(count, 1)
+    result[count == 0] = np.nan
+    return result
 
 
 class HistoryManager:
-    def __init__(self, history: List[Tuple[datetime, float, float, float]] = None):
+    def __init__(self, dim_x: int = 900, dim_y: int = 900, capacity: int = 72,
+                 history: List[Tuple[datetime, int, int, float]] = None):
         '''
-        :param history: list of historic values in format (datetime, lat, long, value)
+        Keeps the most recent frames of a radolan grid. Values are stored in a ring buffer of shape
+        (capacity, dim_x, dim_y) with one timestamp per frame, which is allocated with the first value added. That is
+        3.24 MB per frame of a 900 x 900 grid. Missing values are NaN. Once full, adding a newer frame drops the oldest
+        one.
+
+        :param dim_x: grid rows
+        :param dim_y: grid columns
+        :param capacity: maximum number of frames kept
+        :param history: list of historic values in format (datetime, i, j, value)
         '''
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.__capacity = capacity
+        self.__shape = (dim_x, dim_y)
+        self.__times = np.zeros(capacity, dtype='datetime64[s]')
+        self.__values = None  # type: Optional[np.ndarray]
+        self.__start = 0
+        self.__count = 0
+        self.__windows = {}  # type: Dict[str, RollingWindow]
         if history is not None:
             self.batch_add_points(history)
-        self.__history = {}
 
-    def batch_add_points(self, history: List[Tuple[datetime, float, float, float]]) -> None:
+    def __len__(self) -> int:
+        return self.__count
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.__shape
+
+    def times(self) -> np.ndarray:
+        '''
+        :return: timestamps of all stored frames in ascending order
+        '''
+        return self.__times[self.__physical(np.arange(self.__count))]
+
+    def add_frame(self, date_time: datetime, frame: np.ndarray, nodataflag: float = None) -> None:
+        '''
+        Add a whole decoded frame at once
+
+        :param date_time: datetime
+        :param frame: values of shape (dim_x, dim_y)
+        :param nodataflag: Optional value of cells without data. These cells are stored as missing
+        '''
+        timestamp = np.datetime64(date_time, 's')
+        appended = self.__count == 0 or self.__times[self.__physical(self.__count - 1)] < timestamp
+        slot = self.__slot(date_time, create=True)
+        if slot is None:
+            return
+        self.__values[slot] = frame
+        if nodataflag is not None:
+            self.__values[slot][frame == nodataflag] = np.nan
+        for window in self.__windows.values():
+            if appended:
+                window.push(timestamp, self.__values[slot], self)
+            else:
+                window.invalidate()
+
+    def batch_add_points(self, history: List[Tuple[datetime, int, int, float]]) -> None:
         '''
         Add more than one value
 
-        :param history: list of historic values in format (datetime, lat, long, value)
+        :param history: list of historic values in format (datetime, i, j, value)
         '''
-        for date_time, lat, long, value in history:
-            self.add_point(date_time, lat, long, value)
+        for date_time, i, j, value in history:
+            self.add_point(date_time, i, j, value)
 
-    def add_point(self, date_time: datetime, lat: float, long: float, value: float) -> None:
+    def add_point(self, date_time: datetime, i: int, j: int, value: float) -> None:
         '''
-        Add a single point
+        Add a single point. Adding data in chronological order is O(1).
 
         :param date_time: datetime
-        :param lat:  latitude
-        :param long:  longitude
+        :param i: grid row
+        :param j: grid column
         :param value: value
-        :return_
         '''
-        key = self.__get_key(lat, long)
-        if key not in self.__history:
-            self.__history[key] = []
-        self.__history[key].append((date_time, value))
-        self.__history[key].sort()
+        slot = self.__slot(date_time, create=True)
+        if slot is not None:
+            self.__values[slot, i, j] = value
+            self.__invalidate_windows()
 
-    def remove_point(self, date_time: datetime, lat: float, long: float) -> None:
+    def remove_point(self, date_time: datetime, i: int, j: int) -> None:
         '''
-        Remove a single point. If more than one value is stored for that location with same datetime, all will be deleted.
+        Remove a single point
+
         :param date_time: datetime
-        :param lat: latitude
-        :param long: longitude
-        :return:
+        :param i: grid row
+        :param j: grid column
         '''
-        key = self.__get_key(lat, long)
-        for saved_date_time, value in self.__history[key]:
-            if saved_date_time > date_time:
-                return  # Entries are ordered
-            if saved_date_time == date_time:
-                self.__history[key].remove((date_time, value))
+        slot = self.__slot(date_time)
+        if slot is not None:
+            self.__values[slot, i, j] = np.nan
+            self.__invalidate_windows()
 
-    def remove_older_than(self, date_time: datetime, lat: float, long: float) -> None:
+    def remove_older_than(self, date_time: datetime) -> None:
         '''
-        Remove all points of that location that are older than datetime
+        Remove all frames that are older than datetime
 
         :param date_time: datetime
-        :param lat: latitude
-        :param long: longitude
-        :return:
         '''
-        key = self.__get_key(lat, long)
-        while self.__history[key][0][0] < date_time:
-            del self.__history[key][0]
+        position = self.__bisect(np.datetime64(date_time, 's'))
+        self.__start = int(self.__physical(position))
+        self.__count -= position
+        if position > 0:
+            self.__invalidate_windows()
 
-    def get_value(self, date_time: datetime, lat: float, long: float) -> Optional[float]:
+    def get_value(self, date_time: datetime, i: int, j: int) -> Optional[float]:
         '''
         Get value of a point at specific datetime
 
         :param date_time: datetime
-        :param lat: latitude
-        :param long: longitude
-        :return:
+        :param i: grid row
+        :param j: grid column
+        :return: the value or None, if no value is stored
+        '''
+        slot = self.__slot(date_time)
+        if slot is None:
+            return None
+        value = self.__values[slot, i, j]
+        if np.isnan(value):
+            return None
+        return float(value)
+
+    def get_frame(self, date_time: datetime) -> Optional[np.ndarray]:
+        '''
+        Get all values at specific datetime
+
+        :param date_time: datetime
+        :return: read-only view of shape (dim_x, dim_y) or None, if no frame is stored
+        '''
+        slot = self.__slot(date_time)
+        if slot is None:
+            return None
+        frame = self.__values[slot]
+        frame.flags.writeable = False
+        return frame
+
+    def get_range(self, start: datetime, end: datetime, rows: np.ndarray = None,
+                  cols: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Get all frames in the time range [start, end]
+
+        :param start: datetime
+        :param end: datetime
+        :param rows: Optional row indices to select cells, e.g. the masked cells
+        :param cols: Optional column indices to select cells, required if rows are given
+        :return: Tuple of (timestamps, values). Values have shape (frames, dim_x, dim_y) or (frames, cells), if cells
+         are selected. Missing values are NaN.
+        '''
+        first = self.__bisect(np.datetime64(start, 's'))
+        last = self.__bisect(np.datetime64(end, 's') + np.timedelta64(1, 's'))
+        slots = self.__physical(np.arange(first, last))
+        if self.__values is None:
+            cells = self.__shape if rows is None else (len(rows),)
+            return self.__times[slots], np.empty((0,) + cells, dtype=np.float32)
+        if rows is None:
+            return self.__times[slots], self.__values[slots]
+        return self.__times[slots], self.__values[slots[:, None], rows[None, :], cols[None, :]]
+
+    def aggregate(self, start: datetime, end: datetime, method: str = "sum", rows: np.ndarray = None,
+                  cols: np.ndarray = None) -> np.ndarray:
+        '''
+        Aggregates all frames in the time range [start, end] per cell. Missing values are ignored, cells without any
+        value in the range are NaN.
+
+        :param start: datetime
+        :param end: datetime
+        :param method: one of sum, max or mean
+        :param rows: Optional row indices to select cells, e.g. the masked cells
+        :param cols: Optional column indices to select cells, required if rows are given
+        :return: Aggregated values of shape (dim_x, dim_y) or (cells,), if cells are selected
+        '''
+        _check_method(method)
+        _, values = self.get_range(start, end, rows, cols)
+        return _reduce(values, method)
+
+    def add_window(self, name: str, duration: timedelta, method: str = "sum") -> None:
+        '''
+        Registers a rolling window, which aggregates the frames in (newest - duration, newest]. Windows are updated
+        incrementally whenever a newer frame is added with add_frame. Any other modification causes a recomputation on
+        the next read. The capacity should cover the duration of all windows.
+
+        :param name: name of the window
+        :param duration: length of the window, e.g. timedelta(hours=24) for daily accumulations
+        :param method: one of sum, max or mean
+        '''
+        _check_method(method)
+        self.__windows[name] = RollingWindow(duration, method)
+
+    def get_window(self, name: str, rows: np.ndarray = None, cols: np.ndarray = None) -> np.ndarray:
+        '''
+        Get the current values of a rolling window
+
+        :param name: name of the window as given to add_window
+        :param rows: Optional row indices to select cells, e.g. the masked cells
+        :param cols: Optional column indices to select cells, required if rows are given
+        :return: Aggregated values of shape (dim_x, dim_y) or (cells,), if cells are selected
+        '''
+        values = self.__windows[name].values(self)
+        if rows is None:
+            return values
+        return values[rows, cols]
+
+    def newest(self) -> Optional[np.datetime64]:
+        '''
+        :return: timestamp of the newest frame or None, if empty
+        '''
+        if self.__count == 0:
+            return None
+        return self.__times[self.__physical(self.__count - 1)]
+
+    def __invalidate_windows(self) -> None:
+        for window in self.__windows.values():
+            window.invalidate()
+
+    def __physical(self, position):
+        return (self.__start + position) % self.__capacity
+
+    def __bisect(self, timestamp: np.datetime64) -> int:
+        low, high = 0, self.__count
+        while low < high:
+            mid = (low + high) // 2
+            if self.__times[self.__physical(mid)] < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def __slot(self, date_time: datetime, create: bool = False) -> Optional[int]:
+        '''
+        Internal method to find the ring buffer index of a frame
+
+        :param date_time: datetime of the frame
+        :param create: Inserts an empty frame, if none is stored for date_time
+        :return: ring buffer index or None, if the frame is not stored and can't be created
         '''
-        key = self.__get_key(lat, long)
-        for saved_date_time, value in self.__history[key]:
-            if saved_date_time == date_time:
-                return value
-        return None
+        timestamp = np.datetime64(date_time, 's')
+        if self.__count > 0 and self.__times[self.__physical(self.__count - 1)] < timestamp:
+            position = self.__count  # Fast path for chronological data
+        else:
+            position = self.__bisect(timestamp)
+            if position < self.__count and self.__times[self.__physical(position)] == timestamp:
+                return int(self.__physical(position))
+        if not create:
+            return None
+        if self.__values is None:
+            self.__values = np.empty((self.__capacity,) + self.__shape, dtype=np.float32)
 
-    @staticmethod
-    def __get_key(lat: float, long: float) -> str:
+        if self.__count == self.__capacity:
+            if position == 0:
+                return None  # Older than all frames of a full history
+            self.__start = int(self.__physical(1))
+            self.__count -= 1
+            position -= 1
+        if position < self.__count:
+            source = self.__physical(np.arange(position, self.__count))
+            target = self.__physical(np.arange(position + 1, self.__count + 1))
+            self.__times[target] = self.__times[source]
+            self.__values[target] = self.__values[source]
+        slot = int(self.__physical(position))
+        self.__times[slot] = timestamp
+        self.__values[slot] = np.nan
+        self.__count += 1
+        return slot
+
+
+class RollingWindow:
+    def __init__(self, duration: timedelta, method: str):
         '''
-        Internal method to create a key from two floats
+        Running aggregation over the frames of a HistoryManager in (newest - duration, newest]. Sums and counts are
+        updated by adding the newest and subtracting expired frames. Maxima can't be subtracted and are recomputed from
+        the remaining frames, once a frame expires.
 
-        :param lat: latitude
-        :param long: longitude
-        :return: a unique key
+        :param duration: length of the window
+        :param method: one of sum, max or mean
         '''
-        return str(lat) + str(long)
+        self.__duration = np.timedelta64(int(duration.total_seconds()), 's')
+        self.__method = method
+        self.__members = deque()
+        self.__sum = None  # type: Optional[np.ndarray]
+        self.__count = None  # type: Optional[np.ndarray]
+        self.__max = None  # type: Optional[np.ndarray]
+        self.__valid = False
+
+    def invalidate(self) -> None:
+        self.__valid = False
+
+    def push(self, timestamp: np.datetime64, frame: np.ndarray, history: HistoryManager) -> None:
+        '''
+        Adds the newest frame of history and expires old frames
+        '''
+        if not self.__valid:
+            self.__recompute(history)
+            return
+        valid = ~np.isnan(frame)
+        self.__sum += np.where(valid, frame, 0)
+        self.__count += valid
+        if self.__max is not None:
+            np.fmax(self.__max, frame, out=self.__max)
+        self.__members.append(timestamp)
+
+        expired = False
+        while len(self.__members) > 0 and self.__members[0] <= timestamp - self.__duration:
+            old = history.get_frame(self.__members.popleft().astype(datetime))
+            if old is None:  # Already dropped from the history
+                self.__recompute(history)
+                return
+            valid = ~np.isnan(old)
+            self.__sum -= np.where(valid, old, 0)
+            self.__count -= valid
+            expired = True
+        if expired and self.__max is not None and len(self.__members) > 0:
+            _, values = history.get_range(self.__members[0].astype(datetime), timestamp.astype(datetime))
+            self.__max = _reduce(values, "max")
+
+    def values(self, history: HistoryManager) -> np.ndarray:
+        '''
+        :return: Current aggregation, cells without any value are NaN
+        '''
+        if not self.__valid:
+            self.__recompute(history)
+        if self.__method == "max":
+            return self.__max.copy()
+        result = self.__sum.copy()
+        if self.__method == "mean":
+            result /= np.maximum(self.__count, 1)
+        result[self.__count == 0] = np.nan
+        return result
+
+    def __recompute(self, history: HistoryManager) -> None:
+        self.__members.clear()
+        newest = history.newest()
+        if newest is None:
+            values = np.empty((0,) + history.shape, dtype=np.float32)
+            times = np.empty(0, dtype='datetime64[s]')
+        else:
+            times, values = history.get_range((newest - self.__duration + np.timedelta64(1, 's')).astype(datetime),
+                                              newest.astype(datetime))
+        valid = ~np.isnan(values)
+        self.__sum = np.where(valid, values, 0).sum(axis=0, dtype=np.float64)
+        self.__count = valid.sum(axis=0, dtype=np.int32)
+        self.__max = _reduce(values, "max") if self.__method == "max" else None
+        self.__members.extend(times)
+        self.__valid = True
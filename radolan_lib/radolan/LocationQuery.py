@@ -0,0 +1,110 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import wradlib
+
+from radolan_lib.radolan.FrameArchive import FrameArchive
+from radolan_lib.radolan.HistoryManager import HistoryManager
+from radolan_lib.radolan.Point import RADOLAN_ORIGIN, RADOLAN_RESOLUTION
+
+
+class CellIndex:
+    def __init__(self, proj_source, proj_radolan, shape: Tuple[int, int] = (900, 900),
+                 origin: Tuple[float, float] = RADOLAN_ORIGIN, resolution: float = RADOLAN_RESOLUTION):
+        '''
+        Finds the radolan cells of coordinates. Coordinates are projected back onto the regular radolan grid, so the
+        cell follows from the grid origin and resolution in O(1) without searching the reprojected grid.
+
+        :param proj_source: projection of the coordinates, e.g. of EPSG
+        :param proj_radolan: the radolan projection
+        :param shape: (rows, columns) of the grid
+        :param origin: (x, y) of the lower left corner of the grid in the radolan projection
+        :param resolution: size of a cell in the radolan projection
+        '''
+        self.__proj_source = proj_source
+        self.__proj_radolan = proj_radolan
+        self.__shape = shape
+        self.__origin = origin
+        self.__resolution = resolution
+
+    def lookup(self, coordinates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        :param coordinates: array of shape (locations, 2) of (long, lat) or (x, y) in the source projection
+        :return: Tuple of (rows, cols) of the cells containing the coordinates. Both are -1 for coordinates outside
+         the grid.
+        '''
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        xy = np.asarray(wradlib.georef.reproject(coordinates, projection_source=self.__proj_source,
+                                                 projection_target=self.__proj_radolan)).reshape(-1, 2)
+        cols = np.floor((xy[:, 0] - self.__origin[0]) / self.__resolution)
+        rows = np.floor((xy[:, 1] - self.__origin[1]) / self.__resolution)
+        outside = ~np.isfinite(rows) | ~np.isfinite(cols) | (rows < 0) | (rows >= self.__shape[0]) | \
+            (cols < 0) | (cols >= self.__shape[1])
+        rows = np.where(outside, -1, rows).astype(np.int64)
+        cols = np.where(outside, -1, cols).astype(np.int64)
+        return rows, cols
+
+
+class LocationQuery:
+    def __init__(self, index: CellIndex, history: HistoryManager = None, archive: FrameArchive = None):
+        '''
+        Answers time series queries for many locations at once
+
+        :param index: index to find the cells of the locations
+        :param history: Optional in-memory history, used for all timestamps it holds
+        :param archive: Optional local archive, used for timestamps not in the history
+        '''
+        if history is None and archive is None:
+            raise ValueError("history or archive required")
+        self.__index = index
+        self.__history = history
+        self.__archive = archive
+
+    def time_series(self, coordinates: np.ndarray, start: datetime,
+                    end: datetime = None) -> Tuple[List[datetime], np.ndarray]:
+        '''
+        :param coordinates: array of shape (locations, 2) in the projection of the index
+        :param start: first datetime to include
+        :param end: Optional first datetime to exclude
+        :return: Tuple of (timestamps in chronological order, values of shape (timestamps, locations)). Values are NaN
+         where no data is available, e.g. for locations outside the grid or outside the archived cells.
+        '''
+        rows, cols = self.__index.lookup(coordinates)
+        inside = np.flatnonzero(rows >= 0)
+        series = {}  # type: Dict[datetime, np.ndarray]
+        if self.__archive is not None:
+            times, values = self.__archive.read_cells(rows[inside], cols[inside], start, end)
+            for date_time, row in zip(times, values):
+                series[date_time] = row
+        if self.__history is not None and len(self.__history) > 0:
+            last = end - timedelta(seconds=1) if end is not None else self.__newest()
+            if last is not None:
+                times, values = self.__history.get_range(start, last, rows[inside], cols[inside])
+                for timestamp, row in zip(times.tolist(), values):
+                    series[timestamp] = row
+        times = sorted(series.keys())
+        result = np.full((len(times), len(rows)), np.nan)
+        if len(times) > 0 and len(inside) > 0:
+            result[:, inside] = np.stack([series[date_time] for date_time in times])
+        return times, result
+
+    def __newest(self) -> Optional[datetime]:
+        newest = self.__history.newest()
+        if newest is None:
+            return None
+        return newest.astype("datetime64[s]").tolist()
@@ -0,0 +1,101 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Any
+
+STATUS_DOWNLOADING = "downloading"
+STATUS_DOWNLOADED = "downloaded"
+STATUS_IMPORTED = "imported"
+
+_COLUMNS = ("name", "remote", "size", "mtime", "sha256", "status", "updated")
+
+
+class Manifest:
+    def __init__(self, path: str):
+        '''
+        Persistent record of all downloaded files and completed backfill work units, stored in SQLite
+
+        :param path: database file
+        '''
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__lock, self.__connection:
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, remote TEXT, "
+                                      "size INTEGER, mtime TEXT, sha256 TEXT, status TEXT, updated REAL)")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS units (name TEXT PRIMARY KEY, updated REAL)")
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        '''
+        :param name: local filename without directory
+        :return: the entry as dict or None, if the file is unknown
+        '''
+        with self.__lock:
+            row = self.__connection.execute("SELECT " + ", ".join(_COLUMNS) + " FROM files WHERE name = ?",
+                                            (name,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(_COLUMNS, row))
+
+    def record(self, name: str, remote: str, size: Optional[int], mtime: Optional[str], sha256: Optional[str],
+               status: str) -> None:
+        '''
+        Creates or replaces an entry
+
+        :param name: local filename without directory
+        :param remote: remote URL
+        :param size: remote size in bytes
+        :param mtime: remote modification time as reported by the server
+        :param sha256: hex digest of the complete file
+        :param status: one of STATUS_DOWNLOADING, STATUS_DOWNLOADED or STATUS_IMPORTED
+        '''
+        with self.__lock, self.__connection:
+            self.__connection.execute("INSERT OR REPLACE INTO files (" + ", ".join(_COLUMNS) + ") "
+                                      "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                      (name, remote, size, mtime, sha256, status, time.time()))
+
+    def set_status(self, name: str, status: str) -> None:
+        '''
+        Updates the status of an existing entry
+
+        :param name: local filename without directory
+        :param status: one of STATUS_DOWNLOADING, STATUS_DOWNLOADED or STATUS_IMPORTED
+        '''
+        with self.__lock, self.__connection:
+            self.__connection.execute("UPDATE files SET status = ?, updated = ? WHERE name = ?",
+                                      (status, time.time(), name))
+
+    def is_unit_done(self, name: str) -> bool:
+        '''
+        :param name: name of a backfill work unit
+        :return: True, if the unit was marked as done
+        '''
+        with self.__lock:
+            row = self.__connection.execute("SELECT name FROM units WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def mark_unit_done(self, name: str) -> None:
+        '''
+        Records a completely imported backfill work unit
+
+        :param name: name of the unit
+        '''
+        with self.__lock, self.__connection:
+            self.__connection.execute("INSERT OR REPLACE INTO units (name, updated) VALUES (?, ?)", (name, time.time()))
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__connection.close()
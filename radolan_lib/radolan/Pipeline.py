@@ -0,0 +1,278 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator, List, Any, Dict, Optional
+
+from import_lib.import_lib import get_logger
+
+from radolan_lib.util.metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+_END = object()
+
+
+class StageMetrics:
+    def __init__(self, name: str, input_queue: Optional[queue.Queue], pipeline: str = ""):
+        '''
+        Throughput and queue depth of a single pipeline stage. Totals are also exported to the metrics registry.
+
+        :param name: name of the stage
+        :param input_queue: queue the stage reads from, None for the source stage
+        :param pipeline: kind of pipeline, used as metric label
+        '''
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.__input_queue = input_queue
+        self.__lock = threading.Lock()
+        self.__items = REGISTRY.counter("radolan_stage_items_total", "Items processed by a pipeline stage",
+                                        pipeline=pipeline, stage=name)
+        self.__busy = REGISTRY.counter("radolan_stage_busy_seconds_total", "Time a pipeline stage spent working",
+                                       pipeline=pipeline, stage=name)
+        self.__depth = REGISTRY.gauge("radolan_stage_queue_depth", "Items waiting for a pipeline stage",
+                                      pipeline=pipeline, stage=name)
+
+    def record(self, items_out: int, busy_seconds: float, items_in: int = 1) -> None:
+        depth = self.queue_depth
+        with self.__lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy_seconds += busy_seconds
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        self.__items.inc(items_in)
+        self.__busy.inc(busy_seconds)
+        self.__depth.set(depth)
+
+    @property
+    def queue_depth(self) -> int:
+        if self.__input_queue is None:
+            return 0
+        return self.__input_queue.qsize()
+
+    def to_dict(self, elapsed: float) -> Dict[str, Any]:
+        with self.__lock:
+            return {
+                "stage": self.name,
+                "items_in": self.items_in,
+                "items_out": self.items_out,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "items_per_second": round(self.items_in / elapsed, 3) if elapsed > 0 else 0.0,
+                "utilization": round(self.busy_seconds / elapsed, 3) if elapsed > 0 else 0.0,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+
+class Pipeline:
+    def __init__(self, name: str, queue_size: int = 4, log_interval: float = 60):
+        '''
+        Runs a chain of stages concurrently, each in its own thread. Stages are connected by bounded queues, so a slow
+        stage blocks the ones before it instead of buffering unbounded amounts of data. Each stage processes its items
+        in order, so the output order matches the source order.
+
+        :param name: name of the pipeline, used for logging
+        :param queue_size: capacity of the queues between stages
+        :param log_interval: seconds between metric log lines, 0 disables periodic logging
+        '''
+        self.__name = name
+        self.__queue_size = queue_size
+        self.__log_interval = log_interval
+        self.__stages = []  # type: List[tuple]
+        self.__metrics = []  # type: List[StageMetrics]
+        self.__stop = threading.Event()
+        self.__errors = []  # type: List[BaseException]
+        self.__started = None
+
+    def add_stage(self, name: str, func: Callable[[Any], Optional[Iterable[Any]]], executor: Executor = None,
+                  window: int = None) -> 'Pipeline':
+        '''
+        Appends a stage. func is called with each item of the previous stage and returns an iterable of items for the
+        next stage, which may be empty. Results of the last stage are discarded.
+        If an executor is given, func is submitted to it for up to window items at once and the results are passed on
+        in the original order. func and its items have to be picklable for process pools.
+
+        :param name: name of the stage
+        :param func: stage function
+        :param executor: Optional executor to run func on
+        :param window: Number of items submitted to the executor ahead of the oldest pending one
+        :return: the pipeline, to allow chaining
+        '''
+        if executor is not None:
+            window = max(1, window if window is not None else self.__queue_size)
+            func = _ParallelStage(func, executor, window)
+        self.__stages.append((name, func))
+        return self
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        '''
+        :return: Per-stage metrics of the current or last run
+        '''
+        elapsed = time.perf_counter() - self.__started if self.__started is not None else 0.0
+        return [m.to_dict(elapsed) for m in self.__metrics]
+
+    def log_metrics(self) -> None:
+        for m in self.metrics():
+            logger.info(self.__name + " stage " + m["stage"] + ": " + str(m["items_in"]) + " items, " +
+                        str(m["items_per_second"]) + " items/s, utilization " + str(m["utilization"]) +
+                        ", queue depth " + str(m["queue_depth"]) + " (max " + str(m["max_queue_depth"]) + ")")
+
+    def run(self, source: Iterable[Any], source_name: str = "source") -> None:
+        '''
+        Runs the pipeline until the source is exhausted and all stages are done. Exceptions raised by any stage stop
+        the pipeline and are re-raised here.
+
+        :param source: iterable feeding the first stage
+        :param source_name: name of the source stage
+        '''
+        self.__stop.clear()
+        self.__errors = []
+        self.__started = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.__queue_size) for _ in self.__stages]
+        kind = self.__name.split("-")[0]  # Names of runs carry dates, which would create a metric series per run
+        self.__metrics = [StageMetrics(source_name, None, kind)]
+        self.__metrics += [StageMetrics(name, queues[k], kind) for k, (name, _) in enumerate(self.__stages)]
+
+        threads = [threading.Thread(target=self.__run_source, args=(source, queues[0], self.__metrics[0]),
+                                    name=self.__name + "-" + source_name, daemon=True)]
+        for k, (name, func) in enumerate(self.__stages):
+            output = queues[k + 1] if k + 1 < len(queues) else None
+            threads.append(threading.Thread(target=self.__run_stage,
+                                            args=(func, queues[k], output, self.__metrics[k + 1]),
+                                            name=self.__name + "-" + name, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        last_log = time.perf_counter()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+                if self.__log_interval > 0 and time.perf_counter() - last_log >= self.__log_interval:
+                    self.log_metrics()
+                    last_log = time.perf_counter()
+        self.log_metrics()
+        if len(self.__errors) > 0:
+            raise self.__errors[0]
+
+    def __put(self, q: queue.Queue, item: Any) -> bool:
+        while not self.__stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __get(self, q: queue.Queue) -> Any:
+        while not self.__stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END
+
+    def __fail(self, e: BaseException) -> None:
+        self.__errors.append(e)
+        self.__stop.set()
+
+    def __run_source(self, source: Iterable[Any], output: queue.Queue, metrics: StageMetrics) -> None:
+        try:
+            iterator = iter(source)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                metrics.record(1, time.perf_counter() - start)
+                if not self.__put(output, item):
+                    return
+        except BaseException as e:
+            self.__fail(e)
+            return
+        self.__put(output, _END)
+
+    def __run_stage(self, func: Callable[[Any], Optional[Iterable[Any]]], input_queue: queue.Queue,
+                    output: Optional[queue.Queue], metrics: StageMetrics) -> None:
+        try:
+            while True:
+                item = self.__get(input_queue)
+                if item is _END:
+                    if isinstance(func, _ParallelStage):
+                        if not self.__forward(func.drain(), output, metrics, items_in=0):
+                            return
+                    break
+                if not self.__forward(func(item), output, metrics):
+                    return
+        except BaseException as e:
+            self.__fail(e)
+            return
+        finally:
+            if isinstance(func, _ParallelStage):
+                func.cancel()
+        if output is not None:
+            self.__put(output, _END)
+
+    def __forward(self, results: Optional[Iterable[Any]], output: Optional[queue.Queue], metrics: StageMetrics,
+                  items_in: int = 1) -> bool:
+        start = time.perf_counter()
+        produced = 0
+        blocked = 0.0
+        if results is not None and (output is not None or isinstance(results, Iterator)):
+            for result in results:
+                produced += 1
+                if output is None:
+                    continue
+                put_start = time.perf_counter()
+                if not self.__put(output, result):
+                    return False
+                blocked += time.perf_counter() - put_start
+        metrics.record(produced, time.perf_counter() - start - blocked, items_in=items_in)
+        return True
+
+
+class _ParallelStage:
+    def __init__(self, func: Callable[[Any], Optional[Iterable[Any]]], executor: Executor, window: int):
+        self.__func = func
+        self.__executor = executor
+        self.__window = window
+        self.__pending = deque()
+
+    def __call__(self, item: Any) -> Iterator[Any]:
+        self.__pending.append(self.__executor.submit(self.__func, item))
+        if len(self.__pending) >= self.__window:
+            return self.__results(self.__pending.popleft().result())
+        return iter(())
+
+    def drain(self) -> Iterator[Any]:
+        while len(self.__pending) > 0:
+            yield from self.__results(self.__pending.popleft().result())
+
+    def cancel(self) -> None:
+        for future in self.__pending:
+            future.cancel()
+        self.__pending.clear()
+
+    @staticmethod
+    def __results(results: Optional[Iterable[Any]]) -> Iterator[Any]:
+        if results is None:
+            return iter(())
+        return iter(results)
@@ -12,11 +12,20 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from typing import Dict, Tuple
+import base64
+from typing import Dict, Tuple, List, Optional, Union
+
+import numpy as np
+
+GRID_FORMAT = "grid"
+ENCODINGS = ("float32", "int16")
+INT16_NODATA = -32768
+RADOLAN_ORIGIN = (-523.4621669218558, -4658.644724265572)
+RADOLAN_RESOLUTION = 1.0
 
 
 def get_message(pos_long: float, pos_lat: float, pos_long_top_right: float, pos_lat_top_right: float, epsg: int, value: float,
-                precision: float, unit: str) -> Dict:
+                precision: float, unit: str, regions: List = None) -> Dict:
     '''
     Uses a single  DWD Radolan SF point to create a message for import by ensuring the correct format
     :param pos_long: longitude position
@@ -27,10 +36,11 @@ def get_message(pos_long: float, pos_lat: float, pos_long_top_right: float, pos_
     :param value: precipitation in mm/d
     :param precision: precision of the measurement
     :param unit: unit of measurement
+    :param regions: Optional ids of the areas of interest containing the point
     :return: An annotated message ready to be imported
     '''
 
-    return {
+    msg = {
         "value": value,
         "meta": {
             "projection": "EPSG:" + str(epsg),
@@ -42,16 +52,103 @@ def get_message(pos_long: float, pos_lat: float, pos_long_top_right: float, pos_
             "long_top_right": pos_long_top_right,
         }
     }
+    if regions is not None:
+        msg["meta"]["regions"] = regions
+    return msg
 
 
-def extract_message(msg: Dict) -> Tuple[float, float, float, str, float, str]:
+def get_grid_message(values: np.ndarray, offset: int, epsg: int, precision: float, unit: str, shape: Tuple[int, int],
+                     mask: str, bboxes: Optional[List[List[float]]], encoding: str = "float32") -> Dict:
+    '''
+    Packs the values of many masked cells into a single message. Metadata is only included once. Cells are identified
+    by their position in the mask, which consumers can rebuild from the radolan grid, the EPSG code and the bboxes.
+    Masks of AREAS can't be rebuilt from the message, so they are not supported.
+    :param values: values of consecutive masked cells, NaN for cells without data
+    :param offset: position of the first value within the masked cells
+    :param epsg: EPSG projection code of the mask
+    :param precision: precision of the measurement
+    :param unit: unit of measurement
+    :param shape: dimensions of the radolan grid
+    :param mask: key identifying the mask, see GridCache.get_key
+    :param bboxes: bounding boxes of the mask, None if the whole grid is used
+    :param encoding: float32 or int16. int16 stores values as multiples of precision
+    :return: An annotated message ready to be imported
     '''
-    Extracts a message
+    if encoding not in ENCODINGS:
+        raise ValueError("Unknown encoding " + str(encoding))
+    nodata = np.isnan(values)
+    if encoding == "int16":
+        packed = np.round(np.where(nodata, 0, values) / precision)
+        packed = np.clip(packed, INT16_NODATA + 1, np.iinfo(np.int16).max).astype("<i2")
+        packed[nodata] = INT16_NODATA
+    else:
+        packed = values.astype("<f4")
+    return {
+        "format": GRID_FORMAT,
+        "values": base64.b64encode(packed.tobytes()).decode("ascii"),
+        "meta": {
+            "projection": "EPSG:" + str(epsg),
+            "unit": unit,
+            "precision": precision,
+            "encoding": encoding,
+            "offset": offset,
+            "count": len(values),
+            "mask": mask,
+            "bboxes": bboxes,
+            "grid_projection": "dwd-radolan",
+            "shape": list(shape),
+            "origin": list(RADOLAN_ORIGIN),
+            "resolution": RADOLAN_RESOLUTION,
+        }
+    }
+
+
+def decode_grid_values(msg: Dict) -> np.ndarray:
+    '''
+    Unpacks the values of a grid message
 
     :param msg: the message
-    :return: Tuple with (lat, long, value, warn_level, warn_event, unit, precision, projection)
+    :return: values of the masked cells starting at msg["meta"]["offset"], NaN for cells without data
     :except ValueError: If the message is not in correct format
     '''
+    if msg.get("format") != GRID_FORMAT or "values" not in msg or "meta" not in msg or "encoding" not in msg["meta"]:
+        raise ValueError
+    meta = msg["meta"]
+    raw = base64.b64decode(msg["values"])
+    if meta["encoding"] == "int16":
+        packed = np.frombuffer(raw, dtype="<i2")
+        values = np.round(packed * meta["precision"], 2)
+        values[packed == INT16_NODATA] = np.nan
+        return values
+    if meta["encoding"] == "float32":
+        return np.round(np.frombuffer(raw, dtype="<f4").astype(np.float64), 2)
+    raise ValueError
+
+
+def extract_message(msg: Dict, grid: np.ndarray = None, mask: np.ndarray = None) \
+        -> Tuple[Union[float, np.ndarray, None], Union[float, np.ndarray, None], Union[float, np.ndarray], str, float,
+                 str]:
+    '''
+    Extracts a message. Grid messages return arrays for lat, long and value. Their coordinates are only available if
+    the reprojected grid and the mask are supplied, otherwise lat and long are None.
+
+    :param msg: the message
+    :param grid: Optional reprojected grid of shape (dim_x, dim_y, 2), only used for grid messages
+    :param mask: Optional boolean mask matching msg["meta"]["mask"], only used for grid messages
+    :return: Tuple with (lat, long, value, unit, precision, projection)
+    :except ValueError: If the message is not in correct format
+    '''
+
+    if msg.get("format") == GRID_FORMAT:
+        values = decode_grid_values(msg)
+        meta = msg["meta"]
+        lat, long = None, None
+        if grid is not None and mask is not None:
+            rows, cols = np.nonzero(mask)
+            cells = slice(meta["offset"], meta["offset"] + len(values))
+            long = grid[rows[cells], cols[cells], 0]
+            lat = grid[rows[cells], cols[cells], 1]
+        return lat, long, values, meta["unit"], meta["precision"], meta["projection"]
 
     if "value" not in msg or "meta" not in msg or "projection" not in \
             msg["meta"] or "unit" not in msg["meta"] or "precision" not in msg["meta"] or "lat" not in \
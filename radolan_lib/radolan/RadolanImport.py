@@ -11,26 +11,85 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import math
 import os
-from datetime import datetime
-from typing import List, Type
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import repeat
+from typing import List, Type, Optional, Tuple, Dict, Union, BinaryIO, Callable, Iterator, Iterable
 
+import numpy as np
 import wradlib
 from import_lib.import_lib import ImportLib, get_logger
 from osgeo import osr
 
 from radolan_lib.radolan.Products import Product, RW, SF, is_known_product
-from radolan_lib.util.bbox import create_mask
+from radolan_lib.util.areas import Area, area_memberships, create_area_mask, parse_areas, rasterize_areas, \
+    read_geojson
+from radolan_lib.util.bbox import create_mask_array
+from radolan_lib.util.filenames import FileIndex, month_start
+from radolan_lib.util.limits import HostLimiter
+from radolan_lib.util.metrics import REGISTRY
+from radolan_lib.util.priority import PriorityGate
+from radolan_lib.util.profiling import Profiler, section
+from radolan_lib.util.tiles import TILE_AGGREGATIONS, block_any, block_reduce, tile_grid
 from radolan_lib.radolan import Point
+from radolan_lib.radolan.Checkpoint import Checkpoint
+from radolan_lib.radolan.DecodePool import DecodePool, Result
+from radolan_lib.radolan.Decoder import read_composite
+from radolan_lib.radolan.DeltaFilter import DeltaFilter
+from radolan_lib.radolan.Emitter import BatchEmitter, ImportLibSink, RateLimitedSink, Sink
+from radolan_lib.radolan.FrameArchive import FrameArchive
 from radolan_lib.radolan.Ftploader import FtpLoader
+from radolan_lib.radolan.GridCache import GridCache
+from radolan_lib.radolan.GridExtractor import GridExtractor, get_top_right
+from radolan_lib.radolan.HistoryManager import HistoryManager
+from radolan_lib.radolan.LocationQuery import CellIndex
+from radolan_lib.radolan.Pipeline import Pipeline
+
+
+AREA_CELLS = "area_cells"
+AREA_OFFSETS = "area_offsets"
+EPOCH = datetime(1970, 1, 1)
+
+
+class ImportStopped(Exception):
+    pass
+
+
+def open_frame_archive(lib: ImportLib, product: Type[Product]) -> Optional[FrameArchive]:
+    '''
+    Opens the local archive of a product in ARCHIVE_DIR. Imports of one product running at the same time have to share
+    it, because each archive instance caches which chunks exist.
+
+    :param lib: Instance of the import-lib
+    :param product: A radolan product
+    :return: the archive or None, if ARCHIVE_DIR is not set
+    '''
+    archive_dir = lib.get_config("ARCHIVE_DIR", None)
+    if archive_dir is None or len(archive_dir) == 0:
+        return None
+    return FrameArchive(archive_dir, product.__name__, tile_size=lib.get_config("ARCHIVE_TILE_SIZE", 100))
 
 
 class RadolanImport:
 
-    def __init__(self, lib: ImportLib, product: Type[Product]):
+    def __init__(self, lib: ImportLib, product: Type[Product], gate: PriorityGate = None,
+                 checkpoint: Checkpoint = None, archive_frames: bool = True, download_dir: str = None,
+                 archive: FrameArchive = None, limiter: HostLimiter = None):
         '''
         :param lib: Instance of the import-lib
         :param product: A radolan product
+        :param gate: Optional gate, historic imports pause publishing while it is held by higher priority work
+        :param checkpoint: Optional checkpoint, which is updated with each file published by historic imports
+        :param archive_frames: Append published frames to the local archive, if ARCHIVE_DIR is set. Disabled for
+         replays, which may use other BBOXES than the archive.
+        :param download_dir: Folder to download to. Default: DATA_DIR. Imports running at the same time need separate
+         folders, because they download the same recent files and remove them once imported.
+        :param archive: Optional archive to append to, see open_frame_archive. Opened from ARCHIVE_DIR if not given and
+         archive_frames is set.
+        :param limiter: Optional limit of concurrent downloads from the remote host, shared with other imports
         '''
 
         if not is_known_product(product):
@@ -42,8 +101,25 @@ class RadolanImport:
         if self.__product == RW:
             self.__dim_x, self.__dim_y = 900, 900
 
+        self.__unit = ""
+        if self.__product == SF:
+            self.__unit = "mm/d"
+        if self.__product == RW:
+            self.__unit = "mm/h"
+
+        self.__interval = timedelta(hours=1)
+        if self.__product == SF:
+            self.__interval = timedelta(days=1)
+        if self.__product == RW:
+            self.__interval = timedelta(hours=1)
+
         self.__lib = lib
         self.__logger = get_logger(__name__)
+        self.__gate = gate
+        self.__checkpoint = checkpoint
+        self.__stop = threading.Event()
+        self.__newest_published = None  # type: Optional[datetime]
+        self.__prepare_metrics()
 
         self.__proj_radolan = wradlib.georef.create_osr("dwd-radolan")
         self.__proj_ll = osr.SpatialReference()
@@ -55,74 +131,490 @@ class RadolanImport:
         if not isinstance(self.__bboxes, List):
             self.__logger.error("Invalid config for BBOXES will not be used")
             self.__bboxes = None
-        self.__ftp_loader = FtpLoader(product=self.__product)
+        self.__areas_config = self.__lib.get_config("AREAS", None)
+        self.__areas = []  # type: List[Area]
+        if self.__areas_config is not None:
+            if self.__lib.get_config("OUTPUT_FORMAT", "points") == Point.GRID_FORMAT:
+                # Consumers rebuild the mask of grid messages from the bboxes in their metadata
+                raise ValueError("AREAS is not supported with OUTPUT_FORMAT " + Point.GRID_FORMAT)
+            self.__areas_config = read_geojson(self.__areas_config)
+            self.__areas = parse_areas(self.__areas_config)
+        if download_dir is None:
+            download_dir = self.__lib.get_config("DATA_DIR", os.sep + 'tmp' + os.sep + 'radolan')
+        self.__ftp_loader = FtpLoader(product=self.__product,
+                                      datadir=download_dir,
+                                      download_workers=self.__lib.get_config("DOWNLOAD_WORKERS", 4),
+                                      listing_ttl=self.__lib.get_config("LISTING_TTL", 300),
+                                      limiter=limiter)
+        self.__stream_archives = self.__lib.get_config("STREAM_ARCHIVES", True)
+        self.__decode_processes = self.__lib.get_config("DECODE_PROCESSES", 1)
+        self.__decode_pool = None  # type: Optional[DecodePool]
+        self.__decode_pool_lock = threading.Lock()
+        self.__native_decoder = self.__lib.get_config("NATIVE_DECODER", True)
+        self.__archive = archive
+        if archive is None and archive_frames:
+            self.__archive = open_frame_archive(self.__lib, self.__product)
+        self.__prepare_grid(self.__lib.get_config("GRID_CACHE_DIR", os.sep + 'tmp' + os.sep + 'radolan-grid'))
+        sink = ImportLibSink(self.__lib)  # type: Sink
+        rate_limit = self.__lib.get_config("PUBLISH_RATE_LIMIT", 0)
+        if rate_limit > 0:
+            sink = RateLimitedSink(sink, rate_limit)
+        self.__emitter = BatchEmitter(sink,
+                                      batch_size=self.__lib.get_config("PUBLISH_BATCH_SIZE", 1000),
+                                      linger=self.__lib.get_config("PUBLISH_LINGER", 1.0))
+        self.__output_format = self.__lib.get_config("OUTPUT_FORMAT", "points")
+        if self.__output_format not in ("points", Point.GRID_FORMAT):
+            raise ValueError("Unknown OUTPUT_FORMAT " + str(self.__output_format))
+        self.__grid_encoding = self.__lib.get_config("GRID_ENCODING", "float32")
+        if self.__grid_encoding not in Point.ENCODINGS:
+            raise ValueError("Unknown GRID_ENCODING " + str(self.__grid_encoding))
+        self.__grid_message_cells = self.__lib.get_config("GRID_MESSAGE_CELLS", 100000)
+        self.__tile_size = self.__lib.get_config("TILE_SIZE", 1)
+        self.__tile_aggregation = self.__lib.get_config("TILE_AGGREGATION", "mean")
+        self.__tile_extractor = None
+        if self.__tile_size > 1 and self.__output_format == Point.GRID_FORMAT:
+            self.__logger.warning("TILE_SIZE is not supported with OUTPUT_FORMAT " + Point.GRID_FORMAT +
+                                  " and will not be used")
+        elif self.__tile_size > 1:
+            if self.__tile_aggregation not in TILE_AGGREGATIONS:
+                raise ValueError("Unknown TILE_AGGREGATION " + str(self.__tile_aggregation))
+            lower_left, top_right = tile_grid(self.__radolan_grid_ll, self.__tile_size)
+            self.__tile_extractor = GridExtractor(lower_left, block_any(self.__mask, self.__tile_size), top_right)
+        self.__delta_filter = None
+        if self.__lib.get_config("DELTA_MODE", False) and self.__output_format == Point.GRID_FORMAT:
+            self.__logger.warning("DELTA_MODE is not supported with OUTPUT_FORMAT " + Point.GRID_FORMAT +
+                                  " and will not be used")
+        elif self.__lib.get_config("DELTA_MODE", False):
+            self.__delta_filter = DeltaFilter(len(self.__point_extractor()),
+                                              keyframe_interval=self.__lib.get_config("DELTA_KEYFRAME_INTERVAL", 24))
+        self.__prepare_history(self.__lib.get_config("HISTORY_FRAMES", 0), self.__lib.get_config("ROLLING_WINDOWS", []))
+
+    def __prepare_history(self, frames: int, windows: List[Dict]):
+        '''
+        Keeps the most recent frames in memory, if frames > 0 or rolling windows are configured. The capacity is raised
+        to hold the longest window.
+        :param frames: minimum number of frames kept
+        :param windows: rolling windows as objects with name, hours and optional method
+        '''
+        self.__history = None
+        durations = {}
+        for window in windows:
+            if "name" not in window or "hours" not in window:
+                raise ValueError("Invalid config for ROLLING_WINDOWS, name and hours are required")
+            durations[window["name"]] = timedelta(hours=window["hours"])
+            # One more frame, so the expiring frame is still stored when the window is updated
+            frames = max(frames, math.ceil(durations[window["name"]] / self.__interval) + 1)
+        if frames <= 0:
+            return
+        self.__history = HistoryManager(self.__dim_x, self.__dim_y, capacity=frames)
+        for window in windows:
+            self.__history.add_window(window["name"], durations[window["name"]], window.get("method", "sum"))
+
+    def __prepare_metrics(self):
+        labels = {"product": self.__product.__name__}
+        self.__decode_seconds = REGISTRY.timer("radolan_decode_seconds", "Duration of decoding composites", **labels)
+        self.__invalid_files = REGISTRY.counter("radolan_files_invalid_total", "Files that could not be decoded",
+                                                **labels)
+        self.__mask_seconds = REGISTRY.timer("radolan_mask_seconds", "Duration of selecting the masked cells",
+                                             **labels)
+        self.__publish_seconds = REGISTRY.timer("radolan_publish_seconds", "Duration of publishing composites",
+                                                **labels)
+        self.__points_emitted = REGISTRY.counter("radolan_points_emitted_total", "Points published", **labels)
+        self.__newest_published_gauge = REGISTRY.gauge("radolan_newest_published_timestamp_seconds",
+                                                       "Data time of the newest published composite", **labels)
+        self.__newest_remote_gauge = REGISTRY.gauge("radolan_newest_remote_timestamp_seconds",
+                                                    "Data time of the newest composite offered by the DWD", **labels)
+        self.__lag_gauge = REGISTRY.gauge("radolan_lag_seconds",
+                                          "Data time the newest published composite is behind the newest DWD file",
+                                          **labels)
+        self.__profiler = None
+        profile = self.__lib.get_config("PROFILE", None)
+        if profile:
+            directory = self.__lib.get_config("PROFILE_DIR", os.sep + 'tmp' + os.sep + 'radolan-profiles')
+            self.__profiler = Profiler(profile, directory, every=self.__lib.get_config("PROFILE_EVERY", 100))
+
+    def __prepare_grid(self, cachedir: Optional[str]):
+        '''
+        Loads the reprojected grid, top right corners, mask and areas of interest from the grid cache or computes and
+        caches them
+        :param cachedir: Folder of the grid cache. Caching is disabled if None or empty
+        '''
+        cache = None
+        key = GridCache.get_key(self.__product, self.__dim_x, self.__dim_y, self.__epsg, self.__bboxes,
+                                self.__areas_config)
+        self.__grid_key = key
+        if cachedir:
+            cache = GridCache(cachedir)
+            cached = cache.load(key)
+            area_cells = cache.load_array(key, AREA_CELLS)
+            area_offsets = cache.load_array(key, AREA_OFFSETS)
+            if cached is not None and (len(self.__areas) == 0 or (area_cells is not None and area_offsets is not None)):
+                self.__logger.debug("Using cached grid " + key)
+                self.__radolan_grid_ll, top_right, self.__mask = cached
+                self.__extractor = GridExtractor(self.__radolan_grid_ll, self.__mask, top_right)
+                self.__prepare_regions(area_cells, area_offsets)
+                return
+
         radolan_grid_xy = wradlib.georef.get_radolan_grid(self.__dim_x, self.__dim_y)
         self.__radolan_grid_ll = wradlib.georef.reproject(radolan_grid_xy, projection_source=self.__proj_radolan,
                                                           projection_target=self.__proj_ll)
         self.__logger.debug("Preparing mask...")
-        self.__mask = create_mask(self.__radolan_grid_ll, self.__bboxes)
+        self.__mask = create_mask_array(self.__radolan_grid_ll, self.__bboxes)
+        area_cells, area_offsets = None, None
+        if len(self.__areas) > 0:
+            area_cells, area_offsets = rasterize_areas(self.__radolan_grid_ll, self.__areas)
+            area_mask = create_area_mask((self.__dim_x, self.__dim_y), area_cells)
+            if self.__bboxes is None:
+                self.__mask = area_mask
+            else:
+                self.__mask = self.__mask | area_mask
+        top_right = get_top_right(self.__radolan_grid_ll)
+        self.__extractor = GridExtractor(self.__radolan_grid_ll, self.__mask, top_right)
+        self.__prepare_regions(area_cells, area_offsets)
+        if cache is not None:
+            if area_cells is not None:
+                cache.store_array(key, AREA_CELLS, area_cells)
+                cache.store_array(key, AREA_OFFSETS, area_offsets)
+            cache.store(key, self.__radolan_grid_ll, top_right, self.__mask)
+
+    def __prepare_regions(self, area_cells: Optional[np.ndarray], area_offsets: Optional[np.ndarray]):
+        self.__regions = None
+        if len(self.__areas) > 0:
+            self.__regions = area_memberships(self.__mask, self.__areas, area_cells, area_offsets)
+
+    @property
+    def cell_index(self) -> CellIndex:
+        '''
+        :return: index finding the radolan cells of coordinates in the EPSG projection
+        '''
+        return CellIndex(self.__proj_ll, self.__proj_radolan, shape=(self.__dim_x, self.__dim_y))
+
+    @property
+    def history(self) -> Optional[HistoryManager]:
+        '''
+        :return: the most recent published frames and the ROLLING_WINDOWS over them or None, if not configured. Only
+         cells within BBOXES and AREAS hold values.
+        '''
+        return self.__history
+
+    @property
+    def archive(self) -> Optional[FrameArchive]:
+        '''
+        :return: the local archive frames are appended to or None, if not configured
+        '''
+        return self.__archive
 
     def import_most_recent(self):
-        file = self.__ftp_loader.download_latest()
-        try:
-            self.__logger.info('Imported ' + str(self.import_file(file)) + ' points from most recent data')
-        except OSError as e:
-            self.__logger.error("Could not import file " + file + "due to: " + str(e))
+        files = self.__ftp_loader.download_new()
+        if len(files) == 0:
+            self.__logger.info("No new data available")
+        for file in files:
+            try:
+                frame = self.decode_file(file)
+                if frame is None:  # Invalid DWD data, downloading it again won't help
+                    if os.path.exists(file):
+                        os.remove(file)
+                    self.__ftp_loader.mark_new_imported(file, imported=False)
+                    continue
+                points = self.publish_frame(*frame)
+                self.__ftp_loader.mark_new_imported(file)
+                self.__logger.info('Imported ' + str(points) + ' points from most recent data')
+            except OSError as e:
+                self.__logger.error("Could not import file " + file + " due to: " + str(e))
+        self.__update_lag()
+
+    def __update_lag(self):
+        newest_remote = self.__ftp_loader.newest_remote()
+        if newest_remote is None:
+            return
+        self.__newest_remote_gauge.set((newest_remote - EPOCH).total_seconds())
+        if self.__newest_published is not None:
+            self.__lag_gauge.set(max(0.0, (newest_remote - self.__newest_published).total_seconds()))
 
     def import_from_year(self, year: int, start: datetime = None):
         if year < 2006 and isinstance(self.__product, SF):
             raise ValueError("Year may not be smaller than 2006")
         if year < 2005 and isinstance(self.__product, RW):
             raise ValueError("Year may not be smaller than 2005")
-        self.__ftp_loader.download_from_year(year, callback=self.import_files, start=start)
+        self.__run_pipeline("import-" + str(year), self.__ftp_loader.iter_downloads(year, start=start),
+                            self.__extract_stage(start))
 
-    def import_file(self, file: str, delete_file: bool = True) -> int:
+    @property
+    def host(self) -> str:
+        '''
+        :return: The remote host data is downloaded from
+        '''
+        return self.__ftp_loader.host
+
+    def download_month(self, year: int, month: int, start: datetime = None) -> List[str]:
+        '''
+        Downloads the data of a single month without importing it
+
+        :param year: Year to download data from
+        :param month: Month to download data from
+        :param start: Optional date restriction. Will not download files with data before this datetime
+        :return: Local filenames in chronological order, to be imported with import_downloads
+        '''
+        return self.__ftp_loader.download_month(year, month, start=start)
+
+    def import_downloads(self, files: List[str], start: datetime = None, name: str = "import"):
+        '''
+        Imports downloaded files like historic imports do, the files are removed afterwards
+
+        :param files: Local filenames in chronological order as returned by download_month
+        :param start: Optional date restriction. Files with data before this datetime will not be imported
+        :param name: Name of the import used in logs
+        '''
+        self.__run_pipeline(name, iter(files), self.__extract_stage(start))
+
+    def replay_files(self, files: List[str], start: datetime = None, end: datetime = None):
+        '''
+        Publishes local radolan files and monthly archives again, e.g. with other BBOXES, EPSG or OUTPUT_FORMAT. Files
+        are decoded like historic imports, in DECODE_PROCESSES processes, and published in chronological order. Nothing
+        is downloaded and the files are left untouched.
+
+        :param files: Local filenames, the order doesn't matter
+        :param start: Optional first datetime to publish
+        :param end: Optional first datetime not to publish
+        '''
+        index = FileIndex(files)
+        for name in index.unparsed:
+            self.__logger.debug("Not replaying file with unknown name " + name)
+        # Monthly archives are timestamped with the start of their month
+        names = index.between(month_start(start) if start is not None else datetime.min,
+                              end if end is not None else datetime.max)
+        self.__logger.info("Replaying " + str(len(names)) + " files")
+        self.__run_pipeline("replay", iter(names), lambda file: self.__ftp_loader.iter_archive_members(
+            file, start=start, end=end, remove=False))
+
+    def replay_archive(self, archive: FrameArchive, start: datetime = None, end: datetime = None):
+        '''
+        Publishes frames of the local archive again, e.g. with other BBOXES, EPSG or OUTPUT_FORMAT. Frames are masked in
+        DECODE_PROCESSES threads and published in chronological order.
+
+        :param archive: the archive of this product
+        :param start: Optional first datetime to publish
+        :param end: Optional first datetime not to publish
+        '''
+        pipeline = Pipeline("replay-archive", queue_size=self.__lib.get_config("PIPELINE_QUEUE_SIZE", 4),
+                            log_interval=self.__lib.get_config("PIPELINE_LOG_INTERVAL", 60))
+        workers = max(1, self.__decode_processes)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="radolan-replay")
         try:
-            data, metadata = wradlib.io.read_radolan_composite(file)
-        except (OSError, ValueError) as e:
-            self.__logger.warning(str(e) + " Skipping file! This is most likely caused by invalid DWD data")
+            pipeline.add_stage("select", lambda frame: [(frame[1],) + self.__extractor.select(
+                frame[0], frame[1]['nodataflag'])], executor=executor, window=2 * workers)
+            pipeline.add_stage("publish", lambda selection: self.__publish_historic(
+                selection[0], lambda: self.publish_selection(*selection)))
+            pipeline.run(archive.iter_frames(start, end), source_name="read")
+        finally:
+            executor.shutdown(wait=True)
+
+    def __extract_stage(self, start: Optional[datetime]) -> Callable[[str], Iterable[Union[str, BinaryIO]]]:
+        if self.__stream_archives:
+            return lambda archive: self.__ftp_loader.iter_archive_members(archive, start=start)
+        return lambda archive: self.__ftp_loader.extract_archive(archive, start=start)
+
+    def __run_pipeline(self, name: str, source: Iterator[str],
+                       extract: Callable[[str], Iterable[Union[str, BinaryIO]]]):
+        pipeline = Pipeline(name, queue_size=self.__lib.get_config("PIPELINE_QUEUE_SIZE", 4),
+                            log_interval=self.__lib.get_config("PIPELINE_LOG_INTERVAL", 60))
+        pipeline.add_stage("extract", extract)
+        if self.__decode_processes > 1:
+            decode_pool = self.__get_decode_pool()
+            pipeline.add_stage("decode", DecodePool.decode, executor=decode_pool.executor, window=decode_pool.window)
+            pipeline.add_stage("publish", self.__publish_decoded)
+            try:
+                pipeline.run(source, source_name="download")
+            except BaseException:
+                self.close()  # The pool may be broken, e.g. by a crashed worker
+                raise
+            return
+        pipeline.add_stage("decode", self.__decode_stage)
+        pipeline.add_stage("publish", lambda frame: self.__publish_historic(
+            frame[1], lambda: self.publish_frame(*frame)))
+        pipeline.run(source, source_name="download")
+
+    def __get_decode_pool(self) -> DecodePool:
+        '''
+        Starts the worker processes with the first historic import, later imports reuse them until close is called
+        '''
+        with self.__decode_pool_lock:
+            if self.__decode_pool is None:
+                self.__decode_pool = DecodePool(self.__extractor.rows, self.__extractor.cols, self.__decode_processes,
+                                                native=self.__native_decoder)
+            return self.__decode_pool
+
+    def close(self) -> None:
+        '''
+        Stops the decoding processes of historic imports. They are started again, if another historic import runs.
+        '''
+        with self.__decode_pool_lock:
+            if self.__decode_pool is not None:
+                self.__decode_pool.shutdown()
+                self.__decode_pool = None
+
+    def stop(self) -> None:
+        '''
+        Stops running historic imports before publishing the next file. They raise ImportStopped. Archived frames are
+        written to disk.
+        '''
+        self.__stop.set()
+        if self.__archive is not None:
+            self.__archive.close()
+
+    def __publish_historic(self, metadata: Dict, publish: Callable[[], int]) -> int:
+        while self.__gate is not None and not self.__gate.wait(timeout=1):
+            if self.__stop.is_set():
+                break
+        if self.__stop.is_set():
+            raise ImportStopped()
+        points = publish()
+        if self.__checkpoint is not None:
+            self.__checkpoint.set(metadata['datetime'])
+        return points
+
+    def __publish_decoded(self, result: Result) -> int:
+        '''
+        Publishes a selection of the DecodePool and records the timings of its worker
+        '''
+        selection, decode_seconds, mask_seconds = result
+        self.__decode_seconds.observe(decode_seconds)
+        if selection is None:
+            self.__invalid_files.inc()
             return 0
+        self.__mask_seconds.observe(mask_seconds)
+        return self.__publish_historic(selection[0], lambda: self.publish_selection(*selection))
+
+    def __decode_stage(self, file: Union[str, BinaryIO]) -> List[Tuple[np.ndarray, Dict]]:
+        frame = self.decode_file(file)
+        if frame is None:
+            return []
+        return [frame]
 
-        nodataflag = metadata['nodataflag']
+    def decode_file(self, file: Union[str, BinaryIO], delete_file: bool = True) -> Optional[Tuple[np.ndarray, Dict]]:
+        '''
+        Decodes a radolan composite
+
+        :param file: local filename or an uncompressed file object
+        :param delete_file: Removes the file after decoding. Ignored for file objects
+        :return: Tuple of (data, metadata) or None, if the file could not be decoded
+        '''
+        try:
+            with self.__decode_seconds.time(), section(self.__profiler, "decode"):
+                data, metadata = read_composite(file, native=self.__native_decoder)
+        except (OSError, ValueError) as e:
+            self.__logger.warning(str(e) + " Skipping file " + str(getattr(file, "name", file)) +
+                                  "! This is most likely caused by invalid DWD data")
+            self.__invalid_files.inc()
+            return None
+        if delete_file and isinstance(file, str):
+            os.remove(file)
+        return data, metadata
+
+    def publish_frame(self, data: np.ndarray, metadata: Dict) -> int:
+        '''
+        Publishes all masked points of a decoded composite
+
+        :param data: decoded data
+        :param metadata: decoded metadata
+        :return: number of published points
+        '''
+        with self.__mask_seconds.time():
+            positions, values = self.__extractor.select(data, metadata['nodataflag'])
+        return self.publish_selection(metadata, positions, values)
+
+    def publish_selection(self, metadata: Dict, positions: np.ndarray, values: np.ndarray) -> int:
+        '''
+        Publishes already masked points of a decoded composite. Points are aggregated into tiles if configured. In delta
+        mode only changed points are published. The cells are added to the history and its rolling windows before
+        publishing and appended to the local archive, if configured.
+
+        :param metadata: decoded metadata
+        :param positions: positions within the masked cells as returned by GridExtractor.select
+        :param values: rounded values of these cells
+        :return: number of published points
+        '''
+        if self.__history is not None:
+            frame = np.full((self.__dim_x, self.__dim_y), np.nan, dtype=np.float32)
+            frame[self.__extractor.rows[positions], self.__extractor.cols[positions]] = values
+            self.__history.add_frame(metadata['datetime'], frame)
+        with self.__publish_seconds.time(), section(self.__profiler, "publish"):
+            points = self.__publish_selection(metadata, positions, values)
+        self.__points_emitted.inc(points)
+        newest = metadata['datetime']
+        if self.__newest_published is None or newest > self.__newest_published:
+            self.__newest_published = newest
+            self.__newest_published_gauge.set((newest - EPOCH).total_seconds())
+        return points
+
+    def __publish_selection(self, metadata: Dict, positions: np.ndarray, values: np.ndarray) -> int:
         datetime = metadata['datetime']
         precision = metadata['precision']
-        points = 0
-
-        for i, j in self.__mask:
-            val = round(data[i][j], 2)
-            if val != nodataflag:
-                position_projected = self.__radolan_grid_ll[i][j]
-                lat = position_projected[1]
-                long = position_projected[0]
-                lat_top_right = None
-                long_top_right = None
-                if i+1 < self.__dim_x and j+1 < self.__dim_y:
-                    position_projected_top_right = self.__radolan_grid_ll[i+1][j+1]
-                    lat_top_right = position_projected_top_right[1]
-                    long_top_right = position_projected_top_right[0]
-
-                unit = ""
-
-                if self.__product == SF:
-                    unit = "mm/d"
-                if self.__product == RW:
-                    unit = "mm/h"
-
-                point = Point.get_message(pos_long=long, pos_lat=lat,
-                                          pos_long_top_right=long_top_right,
-                                          pos_lat_top_right=lat_top_right,
-                                          epsg=self.__epsg,
-                                          value=val,
-                                          precision=precision,
-                                          unit=unit)
-                self.__lib.put(datetime, point)
-                self.__logger.debug(str(datetime) + ":" + str(point))
-                points += 1
-
-        if delete_file:
-            os.remove(file)
+        if self.__archive is not None:
+            self.__archive.append(datetime, self.__extractor.rows[positions], self.__extractor.cols[positions], values,
+                                  precision)
+        if self.__output_format == Point.GRID_FORMAT:
+            return self.__publish_grid(datetime, precision, positions, values)
+        if self.__tile_extractor is not None:
+            positions, values = self.__select_tiles(positions, values, metadata['nodataflag'])
+        if self.__delta_filter is not None:
+            positions, values = self.__delta_filter.filter(positions, values)
+
+        regions = repeat(None)
+        if self.__regions is not None and self.__tile_extractor is None:
+            regions = (self.__regions[position] for position in positions.tolist())
+
+        points = self.__emitter.put_all(datetime, (
+            Point.get_message(pos_long=long, pos_lat=lat,
+                              pos_long_top_right=long_top_right,
+                              pos_lat_top_right=lat_top_right,
+                              epsg=self.__epsg,
+                              value=val,
+                              precision=precision,
+                              unit=self.__unit,
+                              regions=point_regions)
+            for (long, lat, long_top_right, lat_top_right, val), point_regions in
+            zip(self.__point_extractor().records(positions, values), regions)))
+        self.__emitter.flush()
+        self.__logger.debug(str(datetime) + ": published " + str(points) + " points")
         return points
 
+    def __point_extractor(self) -> GridExtractor:
+        if self.__tile_extractor is not None:
+            return self.__tile_extractor
+        return self.__extractor
+
+    def __select_tiles(self, positions: np.ndarray, values: np.ndarray,
+                       nodataflag: float) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Aggregates the selected cells into tiles
+        :return: Tuple of (positions within the masked tiles, rounded values)
+        '''
+        frame = np.full((self.__dim_x, self.__dim_y), np.nan)
+        frame[self.__extractor.rows[positions], self.__extractor.cols[positions]] = values
+        tiles = block_reduce(frame, self.__tile_size, self.__tile_aggregation)
+        tiles[np.isnan(tiles)] = nodataflag
+        return self.__tile_extractor.select(tiles, nodataflag)
+
+    def __publish_grid(self, datetime: datetime, precision: float, positions: np.ndarray, values: np.ndarray) -> int:
+        cells = np.full(len(self.__extractor), np.nan)
+        cells[positions] = values
+        messages = (Point.get_grid_message(cells[offset:offset + self.__grid_message_cells], offset=offset,
+                                           epsg=self.__epsg, precision=precision, unit=self.__unit,
+                                           shape=(self.__dim_x, self.__dim_y), mask=self.__grid_key,
+                                           bboxes=self.__bboxes, encoding=self.__grid_encoding)
+                    for offset in range(0, len(cells), self.__grid_message_cells))
+        self.__emitter.put_all(datetime, messages)
+        self.__emitter.flush()
+        self.__logger.debug(str(datetime) + ": published " + str(len(positions)) + " points as grid messages")
+        return len(positions)
+
+    def import_file(self, file: str, delete_file: bool = True) -> int:
+        frame = self.decode_file(file, delete_file)
+        if frame is None:
+            return 0
+        return self.publish_frame(*frame)
+
     def import_files(self, files: List[str], delete_files: bool = True) -> int:
         counter = 0
         for file in files:
@@ -0,0 +1,226 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+Ring = np.ndarray  # shape (vertices, 2) of (long, lat)
+Polygon = List[Ring]  # outer ring followed by holes
+
+
+class Area:
+    def __init__(self, area_id: Any, polygons: List[Polygon]):
+        '''
+        An area of interest made of one or more polygons
+        :param area_id: identifier of the area, used to tag points
+        :param polygons: list of polygons, each a list of rings. The first ring is the outer boundary, all further
+         rings are holes.
+        '''
+        self.id = area_id
+        self.polygons = polygons
+
+    def bbox(self) -> List[float]:
+        '''
+        :return: bounding box as [min Longitude, min Latitude, max Longitude, max Latitude]
+        '''
+        points = np.concatenate([polygon[0] for polygon in self.polygons])
+        return [float(points[:, 0].min()), float(points[:, 1].min()),
+                float(points[:, 0].max()), float(points[:, 1].max())]
+
+
+def read_geojson(config: Union[str, Dict, List]) -> Union[Dict, List]:
+    '''
+    Loads GeoJSON from a file, if config is a path
+    :param config: Path of a GeoJSON file or already parsed GeoJSON
+    :return: parsed GeoJSON
+    '''
+    if isinstance(config, str):
+        with open(config) as f:
+            return json.load(f)
+    return config
+
+
+def parse_areas(config: Union[str, Dict, List]) -> List[Area]:
+    '''
+    Reads areas of interest from GeoJSON. Polygons and MultiPolygons are supported, other geometries are ignored.
+    The area id is taken from the feature id, the properties id or name, or the position of the feature.
+    :param config: Path of a GeoJSON file, a FeatureCollection, a Feature, a geometry or a list of Features
+    :return: list of areas
+    '''
+    config = read_geojson(config)
+    if isinstance(config, dict) and config.get("type") == "FeatureCollection":
+        features = config.get("features", [])
+    elif isinstance(config, dict) and config.get("type") == "Feature":
+        features = [config]
+    elif isinstance(config, dict):
+        features = [{"type": "Feature", "geometry": config}]
+    elif isinstance(config, list):
+        features = config
+    else:
+        raise ValueError("Invalid GeoJSON")
+
+    areas = []
+    for k, feature in enumerate(features):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Polygon":
+            coordinates = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            coordinates = geometry["coordinates"]
+        else:
+            continue
+        properties = feature.get("properties") or {}
+        area_id = feature.get("id", properties.get("id", properties.get("name", k)))
+        polygons = [[np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon] for polygon in coordinates
+                    if len(polygon) > 0]
+        if len(polygons) > 0:
+            areas.append(Area(area_id, polygons))
+    return areas
+
+
+def points_in_polygon(longs: np.ndarray, lats: np.ndarray, polygon: Polygon) -> np.ndarray:
+    '''
+    Vectorized even-odd ray casting. Holes are handled by counting the crossings of all rings.
+    :param longs: point longitudes
+    :param lats: point latitudes
+    :param polygon: list of rings
+    :return: boolean ndarray, True for points inside the polygon
+    '''
+    inside = np.zeros(longs.shape, dtype=bool)
+    for ring in polygon:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        for k in range(len(ring)):
+            if y1[k] == y2[k]:
+                continue
+            crosses = (y1[k] > lats) != (y2[k] > lats)
+            crosses &= longs < (x2[k] - x1[k]) * (lats - y1[k]) / (y2[k] - y1[k]) + x1[k]
+            inside ^= crosses
+    return inside
+
+
+class GridBucketIndex:
+    def __init__(self, grid: np.ndarray, bucket_size: Optional[float] = None):
+        '''
+        Spatial index over the cells of a reprojected grid. Cells are sorted into square buckets by coordinate, so
+        the candidates of a bounding box are found with a few binary searches instead of a scan of the whole grid.
+        :param grid: A 3D ndarray of shape (dim_x, dim_y, 2) holding (long, lat) pairs
+        :param bucket_size: edge length of the buckets in units of the grid projection. Default: the cell spacing,
+         derived from the extent and shape of the grid, so it suits geographic and metric projections alike
+        '''
+        self.__longs = np.asarray(grid[..., 0]).ravel()
+        self.__lats = np.asarray(grid[..., 1]).ravel()
+        if bucket_size is None:
+            extent = max(float(self.__longs.max() - self.__longs.min()), float(self.__lats.max() - self.__lats.min()))
+            bucket_size = extent / max(grid.shape[0], grid.shape[1])
+            if bucket_size <= 0:  # All cells at one position
+                bucket_size = 1.0
+        self.__size = bucket_size
+        self.__long_min = float(self.__longs.min())
+        self.__lat_min = float(self.__lats.min())
+        self.__lat_buckets = int((self.__lats.max() - self.__lat_min) // bucket_size) + 1
+        self.__long_buckets = int((self.__longs.max() - self.__long_min) // bucket_size) + 1
+        keys = self.__keys(self.__longs, self.__lats)
+        self.__order = np.argsort(keys, kind="stable")
+        self.__sorted_keys = keys[self.__order]
+
+    def __keys(self, longs: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        long_bucket = ((longs - self.__long_min) // self.__size).astype(np.int64)
+        lat_bucket = ((lats - self.__lat_min) // self.__size).astype(np.int64)
+        return long_bucket * self.__lat_buckets + lat_bucket
+
+    def query(self, bbox: List[float]) -> np.ndarray:
+        '''
+        :param bbox: bounding box as [min Longitude, min Latitude, max Longitude, max Latitude]
+        :return: flat grid indices of all cells within the bounding box
+        '''
+        first_long = max(0, int((bbox[0] - self.__long_min) // self.__size))
+        last_long = min(self.__long_buckets - 1, int((bbox[2] - self.__long_min) // self.__size))
+        first_lat = max(0, int((bbox[1] - self.__lat_min) // self.__size))
+        last_lat = min(self.__lat_buckets - 1, int((bbox[3] - self.__lat_min) // self.__size))
+        if first_long > last_long or first_lat > last_lat:
+            return np.empty(0, dtype=np.int64)
+        columns = np.arange(first_long, last_long + 1) * self.__lat_buckets
+        starts = np.searchsorted(self.__sorted_keys, columns + first_lat, side="left")
+        ends = np.searchsorted(self.__sorted_keys, columns + last_lat, side="right")
+        candidates = np.concatenate([self.__order[s:e] for s, e in zip(starts, ends)])
+        longs = self.__longs[candidates]
+        lats = self.__lats[candidates]
+        inside = (bbox[0] <= longs) & (longs <= bbox[2]) & (bbox[1] <= lats) & (lats <= bbox[3])
+        return candidates[inside]
+
+    def cells_in_area(self, area: Area) -> np.ndarray:
+        '''
+        :param area: area of interest
+        :return: sorted flat grid indices of all cells within the area
+        '''
+        cells = []
+        for polygon in area.polygons:
+            ring = polygon[0]
+            candidates = self.query([ring[:, 0].min(), ring[:, 1].min(), ring[:, 0].max(), ring[:, 1].max()])
+            inside = points_in_polygon(self.__longs[candidates], self.__lats[candidates], polygon)
+            cells.append(candidates[inside])
+        if len(cells) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(cells))
+
+
+def rasterize_areas(grid: np.ndarray, areas: List[Area]) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Finds the grid cells of all areas
+    :param grid: A 3D ndarray of shape (dim_x, dim_y, 2) holding (long, lat) pairs
+    :param areas: areas of interest
+    :return: Tuple of (flat cell indices of all areas concatenated, offsets). The cells of areas[k] are
+     cells[offsets[k]:offsets[k + 1]].
+    '''
+    index = GridBucketIndex(grid)
+    cells = [index.cells_in_area(area) for area in areas]
+    offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(c) for c in cells])
+    if len(cells) == 0:
+        return np.empty(0, dtype=np.int64), offsets
+    return np.concatenate(cells).astype(np.int64), offsets
+
+
+def create_area_mask(shape: Tuple[int, int], cells: np.ndarray) -> np.ndarray:
+    '''
+    :param shape: grid dimensions
+    :param cells: flat cell indices as returned by rasterize_areas
+    :return: boolean mask of the given shape
+    '''
+    mask = np.zeros(shape[0] * shape[1], dtype=bool)
+    mask[cells] = True
+    return mask.reshape(shape)
+
+
+def area_memberships(mask: np.ndarray, areas: List[Area], cells: np.ndarray,
+                     offsets: np.ndarray) -> List[Union[List[Any], None]]:
+    '''
+    Lists the ids of all areas each masked cell belongs to
+    :param mask: boolean mask of the grid
+    :param areas: areas of interest
+    :param cells: flat cell indices as returned by rasterize_areas
+    :param offsets: offsets as returned by rasterize_areas
+    :return: list with an entry per masked cell in mask order. Entries are lists of area ids or None.
+    '''
+    flat_mask = np.asarray(mask).ravel()
+    positions = np.cumsum(flat_mask) - 1
+    memberships = [None] * int(flat_mask.sum())  # type: List[Union[List[Any], None]]
+    for k, area in enumerate(areas):
+        area_cells = cells[offsets[k]:offsets[k + 1]]
+        for position in positions[area_cells[flat_mask[area_cells]]].tolist():
+            if memberships[position] is None:
+                memberships[position] = []
+            memberships[position].append(area.id)
+    return memberships
@@ -13,6 +13,8 @@
 #  limitations under the License.
 from typing import List, Union, Tuple
 
+import numpy as np
+
 
 def point_in_bbox(lat: float, long: float, bbox: List[float]) -> bool:
     '''
@@ -58,3 +60,40 @@ def create_mask(grid: List[List[List[float]]], bboxes: Union[List[List[float]],
             if point_in_bboxes(lat=xy[1], long=xy[0], bboxes=bboxes):
                 mask.append((i, j))
     return mask
+
+
+def create_mask_array(grid: np.ndarray, bboxes: Union[List[List[float]], None]) -> np.ndarray:
+    '''
+    Vectorized variant of create_mask. Creates a boolean mask of the grid shape, which is True for all points that fit
+    in the bboxes. If bboxes are none, all points will be selected.
+    :param grid: A 3D ndarray of shape (dim_x, dim_y, 2) holding (long, lat) pairs
+    :param bboxes: A list of bounding boxes
+    :return: A boolean ndarray of shape (dim_x, dim_y)
+    '''
+    grid = np.asarray(grid)
+    if bboxes is None:
+        return np.ones(grid.shape[:2], dtype=bool)
+    longs = grid[..., 0]
+    lats = grid[..., 1]
+    mask = np.zeros(grid.shape[:2], dtype=bool)
+    for bbox in bboxes:
+        mask |= (bbox[0] <= longs) & (longs <= bbox[2]) & (bbox[1] <= lats) & (lats <= bbox[3])
+    return mask
+
+
+def mask_to_indices(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Translates a boolean mask into index arrays. The order matches the one of create_mask.
+    :param mask: A boolean mask as created by create_mask_array
+    :return: Tuple of (row indices, column indices)
+    '''
+    return np.nonzero(mask)
+
+
+def mask_to_flat_indices(mask: np.ndarray) -> np.ndarray:
+    '''
+    Translates a boolean mask into indices of the flattened grid
+    :param mask: A boolean mask as created by create_mask_array
+    :return: Flat indices in ascending order
+    '''
+    return np.flatnonzero(mask)
@@ -0,0 +1,127 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import os
+import re
+from bisect import bisect_left
+from datetime import datetime
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+TYPE_COMPOSITE = "composite"
+TYPE_ARCHIVE = "archive"
+
+_COMPOSITE = re.compile(r"^raa01-(?P<product>[a-z]{2})_10000-(?P<timestamp>\d{10})-dwd---bin(?:\.gz)?$")
+_ARCHIVE = re.compile(r"^(?P<product>[A-Z]{2})-?(?P<year>\d{4})(?P<month>\d{2})\.tar(?:\.gz)?$")
+
+
+class ParsedName(NamedTuple):
+    product: str
+    timestamp: datetime
+    type: str
+
+
+@lru_cache(maxsize=65536)
+def parse_filename(name: str) -> Optional[ParsedName]:
+    '''
+    Parses a DWD radolan filename, e.g. raa01-rw_10000-2001010050-dwd---bin.gz or RW-200601.tar.gz
+    :param name: filename, optionally with directory
+    :return: product in upper case, timestamp and type (TYPE_COMPOSITE or TYPE_ARCHIVE). Monthly archives are
+     timestamped at the start of their month. None, if the name does not match any known format.
+    '''
+    name = os.path.basename(name)
+    match = _COMPOSITE.match(name)
+    if match is not None:
+        timestamp = match.group("timestamp")
+        try:
+            return ParsedName(match.group("product").upper(),
+                              datetime(2000 + int(timestamp[0:2]), int(timestamp[2:4]), int(timestamp[4:6]),
+                                       int(timestamp[6:8]), int(timestamp[8:10])), TYPE_COMPOSITE)
+        except ValueError:
+            return None
+    match = _ARCHIVE.match(name)
+    if match is not None:
+        try:
+            return ParsedName(match.group("product"), datetime(int(match.group("year")), int(match.group("month")), 1),
+                              TYPE_ARCHIVE)
+        except ValueError:
+            return None
+    return None
+
+
+def month_start(date_time: datetime) -> datetime:
+    return datetime(date_time.year, date_time.month, 1)
+
+
+def next_month(date_time: datetime) -> datetime:
+    if date_time.month == 12:
+        return datetime(date_time.year + 1, 1, 1)
+    return datetime(date_time.year, date_time.month + 1, 1)
+
+
+class FileIndex:
+    def __init__(self, names: List[str]):
+        '''
+        Index of filenames sorted by the timestamp of their data. Each name is parsed once.
+        :param names: filenames
+        '''
+        parsed = []
+        self.unparsed = []  # type: List[str]
+        for name in names:
+            parsed_name = parse_filename(name)
+            if parsed_name is None:
+                self.unparsed.append(name)
+            else:
+                parsed.append((parsed_name.timestamp, name))
+        parsed.sort()
+        self.__timestamps = [timestamp for timestamp, _ in parsed]
+        self.__names = [name for _, name in parsed]
+
+    def __len__(self) -> int:
+        return len(self.__names) + len(self.unparsed)
+
+    def since(self, start: Optional[datetime]) -> List[str]:
+        '''
+        :param start: Optional datetime
+        :return: names with data from start on in chronological order, followed by names that could not be parsed
+        '''
+        if start is None:
+            return self.__names + self.unparsed
+        return self.__names[bisect_left(self.__timestamps, start):] + self.unparsed
+
+    def newest(self) -> Optional[datetime]:
+        '''
+        :return: the newest timestamp or None, if no name could be parsed
+        '''
+        return self.__timestamps[-1] if len(self.__timestamps) > 0 else None
+
+    def between(self, start: datetime, end: datetime) -> List[str]:
+        '''
+        :param start: first datetime to include
+        :param end: first datetime to exclude
+        :return: names with data from start until end in chronological order. Names that could not be parsed are
+         not included.
+        '''
+        return self.__names[bisect_left(self.__timestamps, start):bisect_left(self.__timestamps, end)]
+
+
+def needs_import(name: str, start: Optional[datetime]) -> bool:
+    '''
+    :param name: filename
+    :param start: Optional datetime
+    :return: False, if the file holds data from before start
+    '''
+    if start is None:
+        return True
+    parsed = parse_filename(name)
+    return parsed is None or parsed.timestamp >= start
@@ -0,0 +1,45 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class HostLimiter:
+    def __init__(self, concurrency: int = 2):
+        '''
+        Limits the number of concurrent transfers per remote host
+
+        :param concurrency: Maximum number of concurrent transfers from one host
+        '''
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.__concurrency = concurrency
+        self.__lock = threading.Lock()
+        self.__semaphores = {}  # type: Dict[str, threading.Semaphore]
+
+    @contextmanager
+    def limit(self, host: str) -> Iterator[None]:
+        '''
+        Context manager, which blocks until a transfer from host may start
+
+        :param host: remote host
+        '''
+        with self.__lock:
+            semaphore = self.__semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.Semaphore(self.__concurrency)
+                self.__semaphores[host] = semaphore
+        with semaphore:
+            yield
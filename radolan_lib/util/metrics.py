@@ -0,0 +1,213 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from import_lib.import_lib import get_logger
+
+logger = get_logger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    def __init__(self):
+        '''
+        Monotonically increasing value, e.g. a number of points or bytes
+        '''
+        self.__lock = threading.Lock()
+        self.__value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self.__lock:
+            self.__value += amount
+
+    @property
+    def value(self) -> float:
+        return self.__value
+
+    def samples(self, name: str) -> List[Tuple[str, float]]:
+        return [(name, self.__value)]
+
+
+class Gauge:
+    def __init__(self):
+        '''
+        Value that may go up and down, e.g. a queue depth
+        '''
+        self.__lock = threading.Lock()
+        self.__value = 0.0
+
+    def set(self, value: float) -> None:
+        self.__value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self.__lock:
+            self.__value += amount
+
+    @property
+    def value(self) -> float:
+        return self.__value
+
+    def samples(self, name: str) -> List[Tuple[str, float]]:
+        return [(name, self.__value)]
+
+
+class Timer:
+    def __init__(self):
+        '''
+        Number, total and maximum of durations in seconds
+        '''
+        self.__lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        with self.__lock:
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, seconds)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        '''
+        Context manager observing the duration of its block
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name: str) -> List[Tuple[str, float]]:
+        with self.__lock:
+            return [(name + "_count", self.count), (name + "_sum", self.sum)]
+
+
+Metric = Union[Counter, Gauge, Timer]
+_TYPES = {Counter: "counter", Gauge: "gauge", Timer: "summary"}
+
+
+class Registry:
+    def __init__(self):
+        '''
+        Collection of named metrics. Metrics are created on first use, a name may be used with different labels.
+        '''
+        self.__lock = threading.Lock()
+        self.__metrics = {}  # type: Dict[str, Tuple[type, str, Dict[Labels, Metric]]]
+
+    def counter(self, name: str, help: str = "", **labels: str) -> Counter:
+        return self.__get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "", **labels: str) -> Gauge:
+        return self.__get(Gauge, name, help, labels)
+
+    def timer(self, name: str, help: str = "", **labels: str) -> Timer:
+        return self.__get(Timer, name, help, labels)
+
+    def render(self) -> str:
+        '''
+        :return: all metrics in the Prometheus text format
+        '''
+        lines = []
+        with self.__lock:
+            metrics = [(name, kind, help, dict(series))
+                       for name, (kind, help, series) in sorted(self.__metrics.items())]
+        for name, kind, help, series in metrics:
+            if help:
+                lines.append("# HELP " + name + " " + help)
+            lines.append("# TYPE " + name + " " + _TYPES[kind])
+            for labels, metric in sorted(series.items()):
+                label_text = ""
+                if len(labels) > 0:
+                    label_text = "{" + ",".join(key + '="' + _escape(value) + '"' for key, value in labels) + "}"
+                for sample, value in metric.samples(name):
+                    lines.append(sample + label_text + " " + repr(float(value)))
+        return "\n".join(lines) + "\n"
+
+    def __get(self, kind: type, name: str, help: str, labels: Dict[str, str]) -> Metric:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self.__lock:
+            entry = self.__metrics.get(name)
+            if entry is None:
+                entry = (kind, help, {})
+                self.__metrics[name] = entry
+            elif entry[0] is not kind:
+                raise ValueError("Metric " + name + " is a " + _TYPES[entry[0]])
+            metric = entry[2].get(key)
+            if metric is None:
+                metric = kind()
+                entry[2][key] = metric
+            return metric
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    def __init__(self, port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+        '''
+        Serves the metrics of a registry at /metrics in a background thread
+
+        :param port: TCP port
+        :param host: address to listen on
+        :param registry: registry to serve
+        '''
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="radolan-metrics", daemon=True)
+        self.__thread.start()
+        logger.info("Serving metrics at http://" + host + ":" + str(self.port) + "/metrics")
+
+    @property
+    def port(self) -> int:
+        return self.__server.server_address[1]
+
+    def shutdown(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+def start_metrics_server(port: Optional[int], host: str = "127.0.0.1") -> Optional[MetricsServer]:
+    '''
+    :param port: TCP port, None or 0 disables the server
+    :param host: address to listen on
+    :return: the running server or None, if disabled
+    '''
+    if not port:
+        return None
+    return MetricsServer(port, host)
@@ -0,0 +1,52 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class PriorityGate:
+    def __init__(self):
+        '''
+        Lets low priority work pause while high priority work is running, e.g. backfills while the live import runs
+        '''
+        self.__lock = threading.Lock()
+        self.__active = 0
+        self.__idle = threading.Event()
+        self.__idle.set()
+
+    @contextmanager
+    def priority(self) -> Iterator[None]:
+        '''
+        Context manager marking high priority work
+        '''
+        with self.__lock:
+            self.__active += 1
+            self.__idle.clear()
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.__active -= 1
+                if self.__active == 0:
+                    self.__idle.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        '''
+        Blocks low priority work until no high priority work is running
+
+        :param timeout: Optional maximum seconds to wait
+        :return: True, if no high priority work is running
+        '''
+        return self.__idle.wait(timeout)
@@ -0,0 +1,110 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import cProfile
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from import_lib.import_lib import get_logger
+
+logger = get_logger(__name__)
+
+MODES = ("cprofile", "tracemalloc")
+
+
+class Profiler:
+    def __init__(self, mode: str, directory: str, every: int = 100):
+        '''
+        Opt-in profiling of hot paths. Every n-th call of each profiled section is run under cProfile, or traced by
+        tracemalloc and followed by a snapshot of the allocations it left, and the result is written to directory.
+        Profilers are only active during these calls, so other calls are not slowed down, unless they run at the same
+        time in another thread.
+
+        :param mode: *cprofile* or *tracemalloc*
+        :param directory: Folder to write .prof and .snapshot files to
+        :param every: Profile every n-th call of a section
+        '''
+        if mode not in MODES:
+            raise ValueError("Unknown profiling mode " + str(mode))
+        os.makedirs(directory, exist_ok=True)
+        self.__mode = mode
+        self.__directory = directory
+        self.__every = max(1, every)
+        self.__calls = {}  # type: Dict[str, int]
+        self.__lock = threading.Lock()
+        self.__tracing = 0  # Number of sampled sections running under tracemalloc started by this profiler
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        '''
+        Context manager marking a profiled section
+
+        :param name: name of the section, used in the filenames
+        '''
+        with self.__lock:
+            calls = self.__calls.get(name, 0) + 1
+            self.__calls[name] = calls
+        if calls % self.__every != 0:
+            yield
+            return
+        file = self.__directory + os.sep + name + "-" + datetime.now().strftime("%Y%m%dT%H%M%S") + "-" + str(calls)
+        if self.__mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # Another profiler is active, e.g. in a concurrent section
+                yield
+                return
+            try:
+                yield
+            finally:
+                profile.disable()
+                profile.dump_stats(file + ".prof")
+                logger.info("Wrote profile " + file + ".prof")
+        else:
+            with self.__lock:
+                if self.__tracing > 0 or not tracemalloc.is_tracing():
+                    if self.__tracing == 0:
+                        tracemalloc.start(25)
+                    self.__tracing += 1
+                    started = True
+                else:  # Traced by someone else, who also stops it
+                    started = False
+            try:
+                yield
+            finally:
+                tracemalloc.take_snapshot().dump(file + ".snapshot")
+                logger.info("Wrote memory snapshot " + file + ".snapshot")
+                with self.__lock:
+                    if started:
+                        self.__tracing -= 1
+                        if self.__tracing == 0:
+                            tracemalloc.stop()
+
+
+@contextmanager
+def _noop() -> Iterator[None]:
+    yield
+
+
+def section(profiler: Optional[Profiler], name: str):
+    '''
+    :return: the profiled section of profiler or a no-op context manager, if profiling is disabled
+    '''
+    if profiler is None:
+        return _noop()
+    return profiler.section(name)
@@ -0,0 +1,77 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+from typing import Tuple
+
+import numpy as np
+
+TILE_AGGREGATIONS = ("mean", "max", "sum")
+
+
+def block_reduce(frame: np.ndarray, size: int, method: str = "mean") -> np.ndarray:
+    '''
+    Reduces a frame into tiles of size x size cells. Missing values (NaN) are ignored, tiles without any value are NaN.
+    Frames that are not divisible by size are padded with missing values.
+    :param frame: 2D ndarray
+    :param size: tile edge length in cells
+    :param method: one of mean, max or sum
+    :return: 2D ndarray of shape (ceil(rows / size), ceil(cols / size))
+    '''
+    if method not in TILE_AGGREGATIONS:
+        raise ValueError("Unknown aggregation " + str(method) + ", expected one of " + str(TILE_AGGREGATIONS))
+    blocks = _blocks(np.asarray(frame, dtype=np.float64), size, np.nan)
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=(1, 3))
+    if method == "max":
+        result = np.where(valid, blocks, -np.inf).max(axis=(1, 3))
+    else:
+        result = np.where(valid, blocks, 0).sum(axis=(1, 3))
+        if method == "mean":
+            result = result / np.maximum(count, 1)
+    result[count == 0] = np.nan
+    return result
+
+
+def block_any(mask: np.ndarray, size: int) -> np.ndarray:
+    '''
+    Reduces a boolean mask into tiles of size x size cells
+    :param mask: 2D boolean ndarray
+    :param size: tile edge length in cells
+    :return: 2D boolean ndarray, True for tiles containing at least one masked cell
+    '''
+    return _blocks(np.asarray(mask, dtype=bool), size, False).any(axis=(1, 3))
+
+
+def tile_grid(grid: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Creates the corner coordinates of all tiles
+    :param grid: A 3D ndarray of shape (dim_x, dim_y, 2) holding (long, lat) pairs
+    :param size: tile edge length in cells
+    :return: Tuple of (lower left corners, top right corners), each of shape (tiles_x, tiles_y, 2). Top right corners
+     outside of the grid are NaN.
+    '''
+    lower_left = np.asarray(grid[::size, ::size])
+    padded = np.full((lower_left.shape[0] * size + 1, lower_left.shape[1] * size + 1, 2), np.nan)
+    padded[:grid.shape[0], :grid.shape[1]] = grid
+    top_right = padded[size::size, size::size]
+    return lower_left, top_right
+
+
+def _blocks(array: np.ndarray, size: int, fill) -> np.ndarray:
+    rows = -(-array.shape[0] // size)
+    cols = -(-array.shape[1] // size)
+    if rows * size != array.shape[0] or cols * size != array.shape[1]:
+        padded = np.full((rows * size, cols * size), fill, dtype=array.dtype)
+        padded[:array.shape[0], :array.shape[1]] = array
+        array = padded
+    return array.reshape(rows, size, cols, size)
@@ -0,0 +1,76 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import os
+import signal
+from datetime import datetime
+
+from import_lib.import_lib import ImportLib, get_logger
+
+from radolan_lib.radolan.FrameArchive import FrameArchive, META_FILE
+from radolan_lib.radolan.Products import str_to_product
+from radolan_lib.radolan.RadolanImport import RadolanImport, ImportStopped
+from radolan_lib.util.metrics import start_metrics_server
+
+if __name__ == '__main__':
+    '''
+    Publishes local data again without downloading anything, e.g. to feed a new downstream system or to change
+    BBOXES, EPSG or OUTPUT_FORMAT. Run with: python -u ./replay.py
+    '''
+    lib = ImportLib()
+    logger = get_logger(__name__)
+    start_metrics_server(lib.get_config("METRICS_PORT", 0), lib.get_config("METRICS_HOST", "127.0.0.1"))
+    product = lib.get_config("PRODUCT", "SF")
+    try:
+        product = str_to_product(product)
+    except ValueError as e:
+        logger.error(e)
+        logger.error("Can't run with this product name. Exiting!")
+        quit(1)
+
+    try:
+        start = lib.get_config("REPLAY_START", None)
+        start = datetime.fromisoformat(start) if start is not None else None
+        end = lib.get_config("REPLAY_END", None)
+        end = datetime.fromisoformat(end) if end is not None else None
+    except (TypeError, ValueError) as e:
+        logger.error("Invalid REPLAY_START or REPLAY_END: " + str(e))
+        quit(1)
+
+    radolan_import = RadolanImport(lib, product=product, archive_frames=False)
+    signal.signal(signal.SIGTERM, lambda signum, frame: radolan_import.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: radolan_import.stop())
+
+    source = lib.get_config("REPLAY_SOURCE", "files")
+    try:
+        if source == "archive":
+            archive_dir = lib.get_config("ARCHIVE_DIR", None)
+            if archive_dir is None or not os.path.exists(archive_dir + os.sep + product.__name__ + os.sep + META_FILE):
+                logger.error("No archive of " + product.__name__ + " found in ARCHIVE_DIR. Exiting!")
+                quit(1)
+            radolan_import.replay_archive(FrameArchive(archive_dir, product.__name__), start, end)
+        elif source == "files":
+            directory = lib.get_config("REPLAY_DIR", lib.get_config("DATA_DIR", os.sep + 'tmp' + os.sep + 'radolan'))
+            files = [directory + os.sep + name for name in os.listdir(directory)
+                     if os.path.isfile(directory + os.sep + name)]
+            radolan_import.replay_files(files, start, end)
+        else:
+            logger.error("Unknown REPLAY_SOURCE " + str(source) + ". Exiting!")
+            quit(1)
+        logger.info("Replay finished")
+    except ImportStopped:
+        logger.info("Replay stopped")
+    finally:
+        radolan_import.close()
@@ -0,0 +1,92 @@
+#  Copyright 2020 InfAI (CC SES)
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+'''
+Cross-checks the native decoder against wradlib with synthetic SF and RW composites.
+Run from the repository root: python -m unittest discover tests
+'''
+
+import gzip
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+import wradlib
+
+from benchmarks.synthetic import write_composites
+from radolan_lib.radolan import Decoder
+
+MASKS = ("nodatamask", "cluttermask", "secondary")
+
+
+class DecoderTest(unittest.TestCase):
+    def setUp(self):
+        self.__tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.__tmp.cleanup)
+
+    def __write(self, product: str, compressed: bool):
+        return write_composites(os.path.join(self.__tmp.name, product + str(compressed)), product,
+                                datetime(2021, 6, 1, 5, 50), 2, compressed)
+
+    def __assert_same(self, data: np.ndarray, attrs: dict, expected: np.ndarray, expected_attrs: dict):
+        self.assertEqual(expected.shape, data.shape)
+        self.assertEqual(expected.dtype, data.dtype)
+        np.testing.assert_array_equal(expected, data)
+        for key in MASKS:
+            np.testing.assert_array_equal(np.asarray(expected_attrs[key]), np.asarray(attrs[key]), err_msg=key)
+        self.assertGreater(len(attrs["nodatamask"]), 0)
+        self.assertGreater(len(attrs["cluttermask"]), 0)
+        for key, value in expected_attrs.items():
+            if key in MASKS or key not in attrs:
+                continue
+            if isinstance(value, np.ndarray):
+                np.testing.assert_array_equal(value, np.asarray(attrs[key]), err_msg=key)
+            else:
+                self.assertEqual(value, attrs[key], key)
+
+    def test_decode(self):
+        for product in Decoder.SUPPORTED_PRODUCTS:
+            for file in self.__write(product, compressed=False):
+                with self.subTest(product=product, file=os.path.basename(file)):
+                    expected, expected_attrs = wradlib.io.read_radolan_composite(file)
+                    with open(file, "rb") as f:
+                        data, attrs = Decoder.decode(f.read())
+                    self.__assert_same(data, attrs, expected, expected_attrs)
+                    for key in ("producttype", "datetime", "precision", "intervalseconds", "nrow", "ncol"):
+                        self.assertIn(key, attrs)
+
+    def test_read_radolan_composite(self):
+        for product in Decoder.SUPPORTED_PRODUCTS:
+            for compressed in (True, False):
+                for file in self.__write(product, compressed):
+                    expected, expected_attrs = wradlib.io.read_radolan_composite(file)
+                    with open(file, "rb") as f:
+                        content = f.read()
+                    if compressed:
+                        content = gzip.decompress(content)
+                    for source in (file, io.BytesIO(content)):
+                        with self.subTest(product=product, compressed=compressed, source=type(source).__name__):
+                            data, attrs = Decoder.read_radolan_composite(source)
+                            self.__assert_same(data, attrs, expected, expected_attrs)
+
+    def test_unsupported_product(self):
+        with self.assertRaises(Decoder.UnsupportedFormat):
+            Decoder.decode(b"PG010050100000121BY  1000" + Decoder.ETX + bytes(100))
+
+
+if __name__ == '__main__':
+    unittest.main()